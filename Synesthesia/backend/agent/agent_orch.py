@@ -1,10 +1,55 @@
 import sys,os
+import asyncio
+import json
+
 #sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))   <Added for testing>
 import utils.llm_cfg as llm_cfg
+import utils.llm_cache as llm_cache
 import utils.sysprompts as sysprompts
 
 from utils import json_parser
 from utils.logging_cfg import logger
+from backend.agent.intent_router import IntentRouter
+
+# "tiered" tries keyword rules and MiniLM centroids before the sys_intent LLM call,
+# "llm" always asks the LLM
+INTENT_ROUTER=os.getenv("INTENT_ROUTER","tiered")
+INTENT_MIN_SIM=float(os.getenv("INTENT_MIN_SIM","0.55"))
+INTENT_MIN_MARGIN=float(os.getenv("INTENT_MIN_MARGIN","0.08"))
+
+
+def cached_response(prompt:str,
+                    context:str):
+    """
+    Cached answer for a deterministic call (see llm_cache.CACHEABLE_CONTEXTS), or None.
+    A cache outage only costs the LLM call, it never fails the request.
+    """
+    if not llm_cache.LLM_CACHE_ENABLED or context not in llm_cache.CACHEABLE_CONTEXTS: return None
+    try:
+        result=llm_cache.cache.get(llm_cfg.MODEL_NAME,prompt)
+    except Exception as e:
+        logger.warning(f"[LLM CACHE] Lookup failed:{e}")
+        return None
+    if result is not None:
+        logger.debug(f"[LLM CACHE] Hit Context={context}")
+    return result
+
+
+def cache_response(prompt:str,
+                   context:str,
+                   result:str):
+    if not llm_cache.LLM_CACHE_ENABLED or context not in llm_cache.CACHEABLE_CONTEXTS: return
+    if not result or not result.strip(): return
+    key=llm_cache.CACHE_JSON_KEYS.get(context)
+    if key is not None:
+        parsed=json_parser.extract_json(result)
+        if not isinstance(parsed,dict) or key not in parsed:
+            logger.debug(f"[LLM CACHE] Not caching unparsable Context={context}")
+            return
+    try:
+        llm_cache.cache.put(llm_cfg.MODEL_NAME,prompt,llm_cache.CACHEABLE_CONTEXTS[context],result)
+    except Exception as e:
+        logger.warning(f"[LLM CACHE] Store failed:{e}")
 
 
 def safe_llm_call(prompt:str,
@@ -19,8 +64,12 @@ def safe_llm_call(prompt:str,
     """
     try:
         logger.debug(f"[SAFE LLM CALL] Context={context},PromptHead={prompt[:200]!r}")
+        cached=cached_response(prompt,context)
+        if cached is not None:
+            return cached
         result=llm_cfg.run_llm(prompt)
         logger.debug(f"[SAFE LLM RESULT] Context={context},ResultHead={result[:200]!r}")
+        cache_response(prompt,context,result)
         return result
 
     except Exception as e:
@@ -28,20 +77,29 @@ def safe_llm_call(prompt:str,
         return f"ERROR:LLM failure during {context}."
 
 
-def categorize_email(email_body:str):
+def run_sync(coro):
     """
-    Runs the categoirzation of email. Look at ag_categorization in utils/sysprompts.py to see how this works.
-    
+    Runs one of the *_async agent functions below from sync code (scripts, worker
+    threads) on a fresh event loop, closing that loop's LLM client afterwards. Must not
+    be called from inside a running event loop.
+
     Parameters: -
-    email_body: email to be classified
+    coro: coroutine to run
     """
-    logger.info("categorize_email() called")
-    try:
-        prompts=sysprompts.load_prompts()
-        base_prompt=prompts.get("ag_categorization")
-        if not base_prompt:
-            raise ValueError("Missing ag_categorization prompt.")
-        prompt=f"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await llm_cfg.aclose_async_client()
+    return asyncio.run(main())
+
+
+def categorize_prompt(email_body:str)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_categorization")
+    if not base_prompt:
+        raise ValueError("Missing ag_categorization prompt.")
+    return f"""
 {base_prompt}
 
 ###EMAIL:
@@ -49,6 +107,18 @@ def categorize_email(email_body:str):
 
 Output JSON only:
 {{"category":"<value>"}}"""
+
+
+def categorize_email(email_body:str):
+    """
+    Runs the categoirzation of email. Look at ag_categorization in utils/sysprompts.py to see how this works.
+    
+    Parameters: -
+    email_body: email to be classified
+    """
+    logger.info("categorize_email() called")
+    try:
+        prompt=categorize_prompt(email_body)
         return safe_llm_call(prompt,context="categorization")
 
     except Exception as e:
@@ -56,6 +126,26 @@ Output JSON only:
         return '{"category":"<err>"}'
 
 
+def action_item_prompt(email_body:str)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_action_item")
+    if not base_prompt:
+        raise ValueError("Missing ag_action_item prompt.")
+    return f"""
+{base_prompt}
+
+###EMAIL:
+{email_body}
+
+Return JSON only:
+{{
+    "tasks":[
+        {{"task":"...","deadline":"..."}}
+    ]
+}}
+"""
+
+
 def action_item_extract(email_body:str,
                         category:str):
     """
@@ -72,12 +162,20 @@ def action_item_extract(email_body:str,
             logger.info("Email classified as spam")
             return '{"tasks":[]}'
 
-        prompts=sysprompts.load_prompts()
-        base_prompt=prompts.get("ag_action_item")
-        if not base_prompt:
-            raise ValueError("Missing ag_action_item prompt.")
-        
-        prompt=f"""
+        prompt=action_item_prompt(email_body)
+        return safe_llm_call(prompt,context="action_item")
+
+    except Exception as e:
+        logger.error(f"[ERROR] action_item_extract failed:{e}",exc_info=True)
+        return '{"tasks":[]}'
+
+
+def triage_prompt(email_body:str)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_triage")
+    if not base_prompt:
+        raise ValueError("Missing ag_triage prompt.")
+    return f"""
 {base_prompt}
 
 ###EMAIL:
@@ -85,44 +183,42 @@ def action_item_extract(email_body:str,
 
 Return JSON only:
 {{
+    "category":"<value>",
     "tasks":[
         {{"task":"...","deadline":"..."}}
     ]
 }}
 """
-        return safe_llm_call(prompt,context="action_item")
-
-    except Exception as e:
-        logger.error(f"[ERROR] action_item_extract failed:{e}",exc_info=True)
-        return '{"tasks":[]}'
 
 
-def autodraft_reply(email_body:str,
-                    category:str,
-                    prel_prompt=None):
+def triage_email(email_body:str):
     """
-    Runs the autodraft reply, generating the reply to be sent. Look at ag_autodraft_reply 
-    in utils/sysprompts.py to see how this works.
-    
+    Single-pass ingestion call: category and tasks from one prompt, so the body is only
+    sent (and prefilled) once. Look at ag_triage in utils/sysprompts.py. The caller
+    applies the spam short-circuit to the returned tasks.
+
     Parameters: -
     email_body: email to be classified
-    category: extracted category from categorize_email()
-    prel_prompt: It is used as primer. Basically, it is the user defined prompt, used like
-    "draft in affirmative", etc. When it is none, we just generate the reply without any 
-    priming and thus, in a generic default tone.
     """
-    logger.info(f"autodraft_reply() called for category={category}")
+    logger.info("triage_email() called")
     try:
-        if category and "spam" in category.lower():
-            return '{"subject":null,"body":null}'
+        prompt=triage_prompt(email_body)
+        return safe_llm_call(prompt,context="triage")
 
-        prompts=sysprompts.load_prompts()
-        base_prompt=prompts.get("ag_autodraft_reply")
-        if not base_prompt:
-            raise ValueError("Missing ag_autodraft_reply prompt.")
-        
-        if prel_prompt is not None:
-            prompt=f"""
+    except Exception as e:
+        logger.error(f"[ERROR] triage_email failed:{e}",exc_info=True)
+        return '{"category":"<err>","tasks":[]}'
+
+
+def autodraft_prompt(email_body:str,
+                     prel_prompt=None)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_autodraft_reply")
+    if not base_prompt:
+        raise ValueError("Missing ag_autodraft_reply prompt.")
+
+    if prel_prompt is not None:
+        return f"""
 {base_prompt}
 
 ###EMAIL:
@@ -136,10 +232,8 @@ Return JSON only:
   "subject":"<string>",
   "body":"<string>"
 }}"""
-            return safe_llm_call(prompt,context="autoreply")
-        
-        else:
-            prompt=f"""
+
+    return f"""
 {base_prompt}
 
 ###EMAIL:
@@ -151,34 +245,30 @@ Return JSON only:
   "body":"<string>"
 }}"""
 
-        return safe_llm_call(prompt,context="autoreply")
- 
-    except Exception as e:
-        logger.error(f"[ERROR] autodraft_reply failed:{e}",exc_info=True)
-        return '{"subject":null,"body":null}'
 
-
-def summary(email_body:str,
-            category:str):
+def autodraft_reply(email_body:str,
+                    category:str,
+                    prel_prompt=None):
     """
-    Runs the summarization. Look at ag_summary in utils/sysprompts.py to see how this works.
+    Runs the autodraft reply, generating the reply to be sent. Look at ag_autodraft_reply 
+    in utils/sysprompts.py to see how this works.
     
     Parameters: -
     email_body: email to be classified
     category: extracted category from categorize_email()
+    prel_prompt: It is used as primer. Basically, it is the user defined prompt, used like
+    "draft in affirmative", etc. When it is none, we just generate the reply without any 
+    priming and thus, in a generic default tone.
     """
-    logger.info(f"summary() called for category={category}")
+    return run_sync(autodraft_reply_async(email_body,category,prel_prompt))
 
-    try:
-        if category and "spam" in category.lower():
-            return "Message is spamm."
 
-        prompts=sysprompts.load_prompts()
-        base_prompt=prompts.get("ag_summary")
-        if not base_prompt:
-            raise ValueError("Missing ag_summary prompt.")
-
-        prompt=f"""
+def summary_prompt(email_body:str)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_summary")
+    if not base_prompt:
+        raise ValueError("Missing ag_summary prompt.")
+    return f"""
 ###PROMPT:
 {base_prompt}
 
@@ -187,34 +277,30 @@ def summary(email_body:str,
 
 Return plaintext only
 """
-        return safe_llm_call(prompt,context="summary")
 
-    except Exception as e:
-        logger.error(f"[ERROR] summary() failed:{e}",exc_info=True)
-        return "Summary unavailable due to system error."
-    
 
-def supersummarizer(user_question:str,
-                    all_emails:list):
+def summary(email_body:str,
+            category:str):
     """
-    Runs the summarization. Look at ag_superquery in utils/sysprompts.py to see how this works.
-    Unlike denoted by the name, this is not a summarizer, as it takes in all the emails as context
-    and helps users answer, categorize, filter across all emails.
+    Runs the summarization. Look at ag_summary in utils/sysprompts.py to see how this works.
     
     Parameters: -
-    user_question: prompt by user
-    all_emails: all the emails in db 
+    email_body: email to be classified
+    category: extracted category from categorize_email()
     """
-    logger.info("supersummarizer() called")
-    try:
-        prompts=sysprompts.load_prompts()
-        base_prompt=prompts.get("ag_superquery")
-        if not base_prompt:
-            raise ValueError("Missing ag_superquery prompt.")
-        
-        inbox_text=""
-        for e in all_emails:
-            inbox_text+=f"""
+    return run_sync(summary_async(email_body,category))
+
+
+def superquery_prompt(user_question:str,
+                      all_emails:list)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("ag_superquery")
+    if not base_prompt:
+        raise ValueError("Missing ag_superquery prompt.")
+
+    inbox_text=""
+    for e in all_emails:
+        inbox_text+=f"""
 ----- EMAIL START -----
 Sender:{e.get('sender')}
 Subject:{e.get('subject')}
@@ -223,7 +309,7 @@ Body:{e.get('body')}
 Actions:{e.get('actions')}
 ----- EMAIL END -----
 """
-        final_prompt=f"""
+    return f"""
 ###BASE PROMPT
 {base_prompt}
 
@@ -235,100 +321,51 @@ Actions:{e.get('actions')}
 
 Return plaintext only.
 """
-        return safe_llm_call(final_prompt,context="superquery")
 
-    except Exception as e:
-        logger.error(f"[ERROR] supersummarizer failed:{e}",exc_info=True)
-        return "Superquery unavailable due to system error."
-
-def orchestrator(email_body:str,
-                 user_question:str,
-                 use_rag:bool=True,
-                 history:list|None=None):
 
+def supersummarizer(user_question:str,
+                    all_emails:list):
     """
-    Orchestrator function, that determines the entire logic. Works by: -
+    Runs the summarization. Look at ag_superquery in utils/sysprompts.py to see how this works.
+    Unlike denoted by the name, this is not a summarizer, as it takes in all the emails as context
+    and helps users answer, categorize, filter across all emails.
     
-    1. At first, emails are categorized by passing them into categorize_emails()
-    2. Then, spam emails are excluded from any further process to save compute.
-    3. The 'intent_prompt' is retrieved. This becomes the dispatch for various LLM prompt calls.
-
-    Parameters: 
-    email_body: email to be classified
+    Parameters: -
     user_question: prompt by user
-    use_rag: RAG switch
-    history: past text conversations.
+    all_emails: all the emails in db 
     """
-    logger.info("orchestrator() triggered")
-    logger.info(f"User question:{user_question}")
-
-    try:
-        prompts=sysprompts.load_prompts()
-        raw_cat=categorize_email(email_body)
-        cat_json=json_parser.extract_json(raw_cat) or {}
-        category_str=cat_json.get("category","General")
-        logger.info(f"Detected category:{category_str}")
-
-        if "spam" in category_str.lower():
-            return {
-                "intent":"spam_blocked",
-                "raw":"No available actions coz email is spam",
-                "json":None
-            }
-
-        intent_prompt=prompts.get("sys_intent")
-        if not intent_prompt:
-            raise ValueError("Missing sys_intent prompt")
-        
-        intent_query=f"""
+    return run_sync(supersummarizer_async(user_question,all_emails))
+
+def intent_prompt(user_question:str)->str:
+    prompts=sysprompts.load_prompts()
+    base_prompt=prompts.get("sys_intent")
+    if not base_prompt:
+        raise ValueError("Missing sys_intent prompt")
+    return f"""
 ### SYSTEM:
-{intent_prompt}
+{base_prompt}
 
 ### USER QUESTION:
 {user_question}
 """
-        intent_raw=safe_llm_call(intent_query,context="intent_classification")
-        intent_json=json_parser.extract_json(intent_raw)
-        intent=intent_json.get("intent","general")
-        logger.info(f"Detected intent={intent}")
-
-        if intent=="categorization":
-            return {"intent":"categorization","raw":raw_cat,"json":cat_json}
-
-        elif intent=="action_item":
-            raw=action_item_extract(email_body,category_str)
-            return {"intent":"action_item","raw":raw,"json":json_parser.extract_json(raw)}
-
-        elif intent=="autoreply":
-            raw=autodraft_reply(email_body,category_str)
-            return {"intent":"autoreply","raw":raw,"json":json_parser.extract_json(raw)}
-
-        elif intent=="summary":
-            raw=summary(email_body,category_str)
-            return {"intent":"summary","raw":raw,"json":None}
-
-        elif intent=="rag" and use_rag is True:
-            try:
-                from backend.rag import rag_search
-                results=rag_search.hybrid_rag(user_question)
-                return {"intent":"rag","results":results}
-            except Exception as e:
-                logger.error(f"[ERROR] RAG search failed:{e}",exc_info=True)
-                return {"intent":"rag","results":[],"error":"RAG search failed"}
-
-        elif intent=="general":
-            sys_instr=prompts.get("ag_general")
-            if not sys_instr:
-                raise ValueError("Missing ag_general prompt.")
-
-            context_block=f"EMAIL CONTENT:\n{email_body}\n\n"
-
-            if history:
-                context_block+="CHAT HISTORY:\n"
-                for msg in history:
-                    context_block+=f"{msg['role'].upper()}:{msg['content']}\n"
-                    
-            final_prompt=f"""
+
+
+def general_prompt(email_body:str,
+                   user_question:str,
+                   history:list|None=None)->str:
+    prompts=sysprompts.load_prompts()
+    sys_instr=prompts.get("ag_general")
+    if not sys_instr:
+        raise ValueError("Missing ag_general prompt.")
+
+    context_block=f"EMAIL CONTENT:\n{email_body}\n\n"
+
+    if history:
+        context_block+="CHAT HISTORY:\n"
+        for msg in history:
+            context_block+=f"{msg['role'].upper()}:{msg['content']}\n"
+
+    return f"""
 ### SYSTEM:
 {sys_instr}
 
@@ -344,19 +381,446 @@ def orchestrator(email_body:str,
 - Otherwise output plain text.
 """
 
-            raw=safe_llm_call(final_prompt,context="general_response")
-            return {"intent":"general","raw":raw,"json":None}
 
-        else:
-            logger.error(f"Unknown intent returned by LLM:{intent}")
-            return {"intent":"unknown","raw":"Unknown intent.","json":None}
+SPAM_BLOCKED={
+    "intent":"spam_blocked",
+    "raw":"No available actions coz email is spam",
+    "json":None
+}
+
+
+def parse_category(raw_cat:str):
+    cat_json=json_parser.extract_json(raw_cat) or {}
+    category_str=cat_json.get("category","General")
+    logger.info(f"Detected category:{category_str}")
+    return cat_json,category_str
+
+
+def parse_intent(intent_raw:str)->str:
+    intent_json=json_parser.extract_json(intent_raw)
+    intent=intent_json.get("intent","general")
+    logger.info(f"Detected intent={intent}")
+    return intent
+
+
+def encode_for_intent(texts:list):
+    # same MiniLM encoder as RAG search, loaded once at API warm-up
+    from backend.rag import rag_search
+    return rag_search.get_embed_model().encode(texts)
+
+
+intent_router=IntentRouter(encode_for_intent,min_sim=INTENT_MIN_SIM,min_margin=INTENT_MIN_MARGIN)
+
+
+# categories written by ingestion when the LLM output could not be parsed; emails
+# carrying them are treated as unprocessed and re-categorized
+UNPROCESSED_CATEGORIES=(None,"","Uncategorized","<err>")
+
+
+def stored_triage(email)->tuple:
+    """
+    (body,category,actions) of an email document or email id. category and actions are
+    None when ingestion has not processed the email yet.
+
+    Parameters: -
+    email: email document, or the id of one
+    """
+    if isinstance(email,str):
+        from backend.db import email_orch
+        email_id=email
+        email=email_orch.get_email(email_id)
+        if email is None:
+            raise ValueError(f"Email not found:{email_id}")
+    category=email.get("category")
+    if category in UNPROCESSED_CATEGORIES:
+        return email.get("body") or "",None,None
+    return email.get("body") or "",category,email.get("actions") or []
+
+
+def stored_category(category:str)->tuple:
+    cat_json={"category":category}
+    logger.info(f"Stored category:{category}")
+    return json.dumps(cat_json),cat_json
+
+
+def route_intent(intent:str,
+                 email_body:str,
+                 user_question:str,
+                 use_rag:bool,
+                 history:list|None,
+                 raw_cat:str,
+                 cat_json:dict,
+                 actions:list|None=None)->dict:
+    """
+    Dispatch half of plan_answer_async(): maps the classified intent to a final result or
+    to the prompt of the generation still to run. Makes no LLM calls, so it runs on a
+    worker thread. Action items stored by ingestion are returned as is.
+    """
+    if intent=="categorization":
+        return {"result":{"intent":"categorization","raw":raw_cat,"json":cat_json}}
+
+    elif intent=="action_item":
+        if actions is not None:
+            tasks={"tasks":actions}
+            return {"result":{"intent":"action_item","raw":json.dumps(tasks),"json":tasks}}
+        return {"intent":"action_item","prompt":action_item_prompt(email_body),"context":"action_item"}
+
+    elif intent=="autoreply":
+        return {"intent":"autoreply","prompt":autodraft_prompt(email_body),"context":"autoreply"}
+
+    elif intent=="summary":
+        return {"intent":"summary","prompt":summary_prompt(email_body),"context":"summary"}
+
+    elif intent=="rag" and use_rag is True:
+        try:
+            from backend.rag import rag_search
+            results=rag_search.hybrid_rag(user_question)
+            return {"result":{"intent":"rag","results":results}}
+        except Exception as e:
+            logger.error(f"[ERROR] RAG search failed:{e}",exc_info=True)
+            return {"result":{"intent":"rag","results":[],"error":"RAG search failed"}}
+
+    elif intent=="general":
+        return {"intent":"general","prompt":general_prompt(email_body,user_question,history),
+                "context":"general_response"}
+
+    else:
+        logger.error(f"Unknown intent returned by LLM:{intent}")
+        return {"result":{"intent":"unknown","raw":"Unknown intent.","json":None}}
+
+
+def finish_answer(intent:str,
+                  raw:str)->dict:
+    if intent in ("action_item","autoreply"):
+        return {"intent":intent,"raw":raw,"json":json_parser.extract_json(raw)}
+    return {"intent":intent,"raw":raw,"json":None}
+
+
+ORCHESTRATOR_ERROR={
+    "intent":"error",
+    "raw":"A system error occurred while processing your request.",
+    "json":None
+}
+
+
+def orchestrator(email_body:str|None,
+                 user_question:str,
+                 use_rag:bool=True,
+                 history:list|None=None,
+                 email=None):
+
+    """
+    Orchestrator function, that determines the entire logic. Sync entry point that runs
+    orchestrator_async() through run_sync(). Works by: -
+    
+    1. The category comes from ingestion when `email` is processed already; otherwise
+       categorize_email_async() runs, concurrently with the intent classification.
+    2. Spam emails are excluded from any further process to save compute; a pending
+       intent call is cancelled.
+    3. The intent (phrase rules, MiniLM centroids, sys_intent LLM as fallback) picks
+       the route in route_intent(). Stored action items are returned as is,
+       categorization and rag need no further call, the rest run one final generation.
+
+    Parameters: 
+    email_body: email to be classified
+    user_question: prompt by user
+    use_rag: RAG switch
+    history: past text conversations.
+    email: email document or id; its stored category and actions are reused, and its
+    body is used when email_body is None
+    """
+    return run_sync(orchestrator_async(email_body,user_question,use_rag,history,email))
+
+
+# Async agent functions, the ones the API calls; the sync autodraft_reply, summary,
+# supersummarizer and orchestrator above run them through run_sync(). Every LLM call
+# awaits the shared httpx client, so a request waiting on ollama holds a socket, not a
+# thread. Prompt building reads the prompts from mongo and is pushed off the event loop.
+
+async def safe_llm_call_async(prompt:str,
+                              context:str=""):
+    """
+    Async safe_llm_call().
+
+    Parameters: -
+    prompt: the input prompt
+    context: context prompt.
+    """
+    try:
+        logger.debug(f"[SAFE LLM CALL] Context={context},PromptHead={prompt[:200]!r}")
+        cached=await asyncio.to_thread(cached_response,prompt,context)
+        if cached is not None:
+            return cached
+        result=await llm_cfg.arun_llm(prompt)
+        logger.debug(f"[SAFE LLM RESULT] Context={context},ResultHead={result[:200]!r}")
+        await asyncio.to_thread(cache_response,prompt,context,result)
+        return result
+
+    except Exception as e:
+        logger.error(f"[LLM ERROR] Context={context} | Error:{str(e)}",exc_info=True)
+        return f"ERROR:LLM failure during {context}."
+
+
+async def safe_llm_stream_async(prompt:str,
+                                context:str=""):
+    """
+    Streaming safe_llm_call_async(): yields response chunks as ollama generates them.
+    Shares the response cache with the blocking call: a hit is yielded as one chunk, and
+    a stream that completes is stored whole. On failure the error text is yielded as the
+    last chunk instead of raising, so a stream that already started still ends cleanly.
+
+    Parameters: -
+    prompt: the input prompt
+    context: context prompt.
+    """
+    try:
+        logger.debug(f"[SAFE LLM STREAM] Context={context},PromptHead={prompt[:200]!r}")
+        cached=await asyncio.to_thread(cached_response,prompt,context)
+        if cached is not None:
+            yield cached
+            return
+        parts=[]
+        async for chunk in llm_cfg.arun_llm_stream(prompt):
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(cache_response,prompt,context,"".join(parts))
+
+    except Exception as e:
+        logger.error(f"[LLM ERROR] Context={context} | Error:{str(e)}",exc_info=True)
+        yield f"ERROR:LLM failure during {context}."
+
+
+async def categorize_email_async(email_body:str):
+    logger.info("categorize_email_async() called")
+    try:
+        prompt=await asyncio.to_thread(categorize_prompt,email_body)
+        return await safe_llm_call_async(prompt,context="categorization")
+
+    except Exception as e:
+        logger.error(f"[ERROR] categorize_email failed:{e}",exc_info=True)
+        return '{"category":"<err>"}'
+
+
+async def action_item_extract_async(email_body:str,
+                                    category:str):
+    logger.info(f"action_item_extract_async() called :category={category}")
+    try:
+        if category and "spam" in category.lower():
+            logger.info("Email classified as spam")
+            return '{"tasks":[]}'
+
+        prompt=await asyncio.to_thread(action_item_prompt,email_body)
+        return await safe_llm_call_async(prompt,context="action_item")
+
+    except Exception as e:
+        logger.error(f"[ERROR] action_item_extract failed:{e}",exc_info=True)
+        return '{"tasks":[]}'
+
+
+async def autodraft_reply_async(email_body:str,
+                                category:str,
+                                prel_prompt=None):
+    logger.info(f"autodraft_reply_async() called for category={category}")
+    try:
+        if category and "spam" in category.lower():
+            return '{"subject":null,"body":null}'
+
+        prompt=await asyncio.to_thread(autodraft_prompt,email_body,prel_prompt)
+        return await safe_llm_call_async(prompt,context="autoreply")
+
+    except Exception as e:
+        logger.error(f"[ERROR] autodraft_reply failed:{e}",exc_info=True)
+        return '{"subject":null,"body":null}'
+
+
+async def autodraft_reply_stream_async(email_body:str,
+                                       category:str,
+                                       prel_prompt=None):
+    logger.info(f"autodraft_reply_stream_async() called for category={category}")
+    if category and "spam" in category.lower():
+        yield '{"subject":null,"body":null}'
+        return
+    try:
+        prompt=await asyncio.to_thread(autodraft_prompt,email_body,prel_prompt)
+    except Exception as e:
+        logger.error(f"[ERROR] autodraft_reply_stream failed:{e}",exc_info=True)
+        yield '{"subject":null,"body":null}'
+        return
+    async for chunk in safe_llm_stream_async(prompt,context="autoreply"):
+        yield chunk
+
+
+async def summary_async(email_body:str,
+                        category:str):
+    logger.info(f"summary_async() called for category={category}")
+    try:
+        if category and "spam" in category.lower():
+            return "Message is spamm."
+
+        prompt=await asyncio.to_thread(summary_prompt,email_body)
+        return await safe_llm_call_async(prompt,context="summary")
+
+    except Exception as e:
+        logger.error(f"[ERROR] summary() failed:{e}",exc_info=True)
+        return "Summary unavailable due to system error."
+
+
+async def supersummarizer_async(user_question:str,
+                                all_emails:list):
+    logger.info("supersummarizer_async() called")
+    try:
+        final_prompt=await asyncio.to_thread(superquery_prompt,user_question,all_emails)
+        return await safe_llm_call_async(final_prompt,context="superquery")
+
+    except Exception as e:
+        logger.error(f"[ERROR] supersummarizer failed:{e}",exc_info=True)
+        return "Superquery unavailable due to system error."
+
+
+async def classify_intent_async(user_question:str)->str:
+    """
+    Intent of the user question: the local router when it is confident, otherwise the
+    sys_intent LLM call.
+
+    Parameters: -
+    user_question: prompt by user
+    """
+    if INTENT_ROUTER=="tiered":
+        # the embedding tier runs the encoder, keep it off the event loop
+        routed=await asyncio.to_thread(intent_router.route,user_question)
+        if routed is not None:
+            return routed[0]
+    query=await asyncio.to_thread(intent_prompt,user_question)
+    intent_raw=await safe_llm_call_async(query,context="intent_classification")
+    intent=parse_intent(intent_raw)
+    logger.info(f"[INTENT] tier=llm intent={intent}")
+    return intent
+
+
+async def plan_answer_async(email_body:str,
+                            user_question:str,
+                            use_rag:bool=True,
+                            history:list|None=None,
+                            category:str|None=None,
+                            actions:list|None=None)->dict:
+    """
+    Everything the orchestrator does before the final generation: categorization, the
+    spam short-circuit, intent classification and building the answer prompt. Returns
+    either {"result":...} when the answer is already known (spam, categorization, rag,
+    unknown intent), or {"intent","prompt","context"} for the generation still to run,
+    so the blocking and the streaming orchestrators share one routing path.
+
+    Parameters: -
+    email_body: email to be classified
+    user_question: prompt by user
+    use_rag: RAG switch
+    history: past text conversations.
+    category, actions: stored by ingestion; when category is given no categorization
+    call is made, otherwise categorization and intent run concurrently.
+    """
+    if category:
+        raw_cat,cat_json=stored_category(category)
+        if "spam" in category.lower():
+            return {"result":dict(SPAM_BLOCKED)}
+        intent=await classify_intent_async(user_question)
+    else:
+        # the intent call is wasted on spam, but spam questions are rare and this way
+        # the two round trips overlap instead of adding up
+        intent_task=asyncio.create_task(classify_intent_async(user_question))
+        try:
+            raw_cat=await categorize_email_async(email_body)
+            cat_json,category_str=parse_category(raw_cat)
+        except BaseException:
+            # a dropped client cancels this coroutine; don't leave the intent call running
+            intent_task.cancel()
+            raise
+        if "spam" in category_str.lower():
+            # the spam answer never waits on the intent call
+            intent_task.cancel()
+            return {"result":dict(SPAM_BLOCKED)}
+        intent=await intent_task
+
+    # route_intent may run a RAG search, which is CPU bound
+    return await asyncio.to_thread(route_intent,intent,email_body,user_question,
+                                   use_rag,history,raw_cat,cat_json,actions)
+
+
+async def resolve_email_async(email_body:str|None,email)->tuple:
+    if email is None:
+        return email_body,None,None
+    body,category,actions=await asyncio.to_thread(stored_triage,email)
+    return (body if email_body is None else email_body),category,actions
+
+
+async def orchestrator_async(email_body:str|None,
+                             user_question:str,
+                             use_rag:bool=True,
+                             history:list|None=None,
+                             email=None):
+    """
+    Answers a question about an email: plan_answer_async() routes it, then the final
+    generation, if any, runs. Returns {"intent","raw","json"} (or the rag results).
+
+    Parameters: -
+    email_body: email to be classified
+    user_question: prompt by user
+    use_rag: RAG switch
+    history: past text conversations.
+    email: email document or id, see orchestrator()
+    """
+    logger.info("orchestrator_async() triggered")
+    logger.info(f"User question:{user_question}")
+
+    try:
+        email_body,category,actions=await resolve_email_async(email_body,email)
+        plan=await plan_answer_async(email_body,user_question,use_rag,history,category,actions)
+        if "result" in plan:
+            return plan["result"]
+        raw=await safe_llm_call_async(plan["prompt"],context=plan["context"])
+        return finish_answer(plan["intent"],raw)
 
     except Exception as e:
         logger.critical(f"[FATAL ERROR] orchestrator crashed:{e}",exc_info=True)
-        return {
-            "intent":"error",
-            "raw":"A system error occurred while processing your request.",
-            "json":None
-        }
+        return dict(ORCHESTRATOR_ERROR)
+
 
+async def orchestrator_stream_async(email_body:str|None,
+                                    user_question:str,
+                                    use_rag:bool=True,
+                                    history:list|None=None,
+                                    email=None):
+    """
+    Streaming orchestrator. Routing (categorization, intent) runs exactly as in
+    orchestrator_async(); the final generation is relayed chunk by chunk. Yields
+    (event,data) pairs: ("intent",{"intent":...}) once the route is known, ("token",str)
+    per chunk and a closing ("done",result) carrying the same dict orchestrator_async()
+    would return.
 
+    Parameters: -
+    email_body: email to be classified
+    user_question: prompt by user
+    use_rag: RAG switch
+    history: past text conversations.
+    email: email document or id, see orchestrator()
+    """
+    logger.info("orchestrator_stream_async() triggered")
+    logger.info(f"User question:{user_question}")
+
+    try:
+        email_body,category,actions=await resolve_email_async(email_body,email)
+        plan=await plan_answer_async(email_body,user_question,use_rag,history,category,actions)
+    except Exception as e:
+        logger.critical(f"[FATAL ERROR] orchestrator crashed:{e}",exc_info=True)
+        yield "done",dict(ORCHESTRATOR_ERROR)
+        return
+
+    if "result" in plan:
+        yield "done",plan["result"]
+        return
+
+    yield "intent",{"intent":plan["intent"]}
+    parts=[]
+    async for chunk in safe_llm_stream_async(plan["prompt"],context=plan["context"]):
+        parts.append(chunk)
+        yield "token",chunk
+    yield "done",finish_answer(plan["intent"],"".join(parts))
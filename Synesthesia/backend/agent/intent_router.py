@@ -0,0 +1,154 @@
+import re
+import threading
+import numpy as np
+
+from backend.utils.logging_cfg import logger
+
+
+INTENTS=("action_item","autoreply","summary","categorization","rag","general")
+
+# imperative phrases that name the intent outright. Bare keywords ("reply", "draft",
+# "task", "summary") also show up in ordinary questions about the email ("what did they
+# respond about the budget?"), so they are left to the embedding and LLM tiers
+KEYWORD_RULES={
+    "action_item":["action items","list the tasks","list my tasks","extract the tasks","extract tasks",
+                   "what do i need to do","what should i do","what are the deadlines","any deadlines"],
+    "autoreply":["reply to this","reply to them","reply to him","reply to her","draft a reply","draft a response",
+                 "write a reply","write a response","write back","compose a reply","compose a response"],
+    "summary":["summarize this","summarize the","summarise this","summarise the","give me a summary",
+               "tldr","tl;dr","short version","main points"],
+    "categorization":["categorize this","categorise this","classify this","is this spam","is it spam",
+                      "is this phishing","what kind of email","what category"],
+    "rag":["search emails","search my emails","search inbox","search the inbox","find emails","look for emails",
+           "show emails","show me emails","emails about","emails from","fetch emails","find similar"],
+}
+
+# labelled example questions; their mean MiniLM embedding is the centroid of each intent
+INTENT_EXAMPLES={
+    "action_item":[
+        "What do I have to do after reading this?",
+        "List the things I'm being asked to handle",
+        "Are there any deadlines I should know about?",
+        "What is expected from me here?",
+        "Which actions does the sender want from me?",
+    ],
+    "autoreply":[
+        "Write a polite answer to this",
+        "Help me answer this email",
+        "Tell them I'll attend the meeting",
+        "Decline this invitation politely",
+        "Say thanks and confirm I received it",
+    ],
+    "summary":[
+        "Give me the key points of this email",
+        "What is this email about in short?",
+        "Boil this down to a few bullets",
+        "Condense this message for me",
+        "Quick overview of this mail please",
+    ],
+    "categorization":[
+        "Is this a scam?",
+        "Should this go in my newsletter folder?",
+        "Is this email important or personal?",
+        "Which folder does this belong in?",
+        "Is this a meeting invite or a to-do?",
+    ],
+    "rag":[
+        "Find the messages that mention the invoice",
+        "Which other emails talk about the budget?",
+        "Look up mails from HR last month",
+        "Show everything related to the Militech contract",
+        "Pull up previous messages about the server outage",
+    ],
+    "general":[
+        "Who sent this?",
+        "What does this sentence mean?",
+        "Explain this email to me",
+        "Why would they send this?",
+        "Translate this into plain English",
+        "Hello, how are you?",
+    ],
+}
+
+
+class IntentRouter:
+    """
+    Cheap tiers in front of the sys_intent LLM call. route() tries, in order:
+
+    1. rules:     imperative phrases; a hit in exactly one group wins (confidence 1.0)
+    2. embedding: cosine of the MiniLM query vector to per-intent centroids of the
+                  example questions; wins when the best similarity is >= min_sim and
+                  beats the runner-up by >= min_margin (confidence = best similarity)
+
+    and returns None when neither is confident, so the caller asks the LLM. Every
+    decision is logged with its tier and confidence for threshold tuning.
+
+    Parameters: -
+    encode_fn: callable mapping a list of texts to an embedding matrix
+    min_sim: lowest centroid similarity the embedding tier accepts
+    min_margin: required gap between the best and second best centroid
+    """
+    def __init__(self,encode_fn,min_sim:float=0.55,min_margin:float=0.08,
+                 rules:dict=KEYWORD_RULES,examples:dict=INTENT_EXAMPLES):
+        self.encode_fn=encode_fn
+        self.min_sim=min_sim
+        self.min_margin=min_margin
+        self.patterns={intent:re.compile(r"(?<!\w)("+"|".join(re.escape(k) for k in words)+r")(?!\w)",re.IGNORECASE)
+                       for intent,words in rules.items()}
+        self.examples=examples
+        self._labels=None
+        self._centroids=None
+        self._lock=threading.Lock()
+
+    def match_rules(self,question:str):
+        hits=[intent for intent,pattern in self.patterns.items() if pattern.search(question)]
+        return hits[0] if len(hits)==1 else None
+
+    def _unit(self,mat):
+        mat=np.asarray(mat,dtype=np.float32)
+        norms=np.linalg.norm(mat,axis=1,keepdims=True)
+        norms[norms==0]=1.0
+        return mat/norms
+
+    def centroids(self):
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    labels=list(self.examples)
+                    cents=[self._unit(self.encode_fn(self.examples[l])).mean(axis=0) for l in labels]
+                    self._labels=labels
+                    self._centroids=self._unit(np.vstack(cents))
+        return self._labels,self._centroids
+
+    def match_embedding(self,question:str)->tuple:
+        """
+        Returns (intent,similarity,margin) of the nearest centroid.
+        """
+        labels,cents=self.centroids()
+        q=self._unit(self.encode_fn([question]))[0]
+        sims=cents@q
+        order=np.argsort(sims)[::-1]
+        best=float(sims[order[0]])
+        margin=best-float(sims[order[1]]) if len(order)>1 else best
+        return labels[order[0]],best,margin
+
+    def route(self,question:str):
+        """
+        Returns (intent,tier,confidence), or None when the LLM should decide.
+        """
+        intent=self.match_rules(question)
+        if intent is not None:
+            logger.info(f"[INTENT] tier=rules intent={intent} confidence=1.0")
+            return intent,"rules",1.0
+
+        try:
+            intent,sim,margin=self.match_embedding(question)
+        except Exception as e:
+            logger.warning(f"[INTENT] Embedding tier unavailable:{e}")
+            return None
+        if sim>=self.min_sim and margin>=self.min_margin:
+            logger.info(f"[INTENT] tier=embedding intent={intent} confidence={sim:.3f} margin={margin:.3f}")
+            return intent,"embedding",round(sim,4)
+
+        logger.info(f"[INTENT] tier=llm fallback nearest={intent} confidence={sim:.3f} margin={margin:.3f}")
+        return None
@@ -1,16 +1,28 @@
+import json
 import tempfile
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI,HTTPException,UploadFile,File,Query
+from fastapi.responses import JSONResponse,StreamingResponse
 from pydantic import BaseModel
 from backend.db import email_orch
 from backend.utils import sysprompts
 from backend import main_orch
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 #sys.path.insert(0,os.path.abspath(os.path.join(os.path.dirname(__file__),"..")))
 
 main=main_orch.Main_Orch()
-app=FastAPI(title="Synesthesia")
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    main.start_warm_up()
+    yield
+    from backend.agent import agent_orch
+    await agent_orch.llm_cfg.aclose_async_client()
+
+app=FastAPI(title="Synesthesia",lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +38,12 @@ def health_chk():
     return {"status":"OK","message":"Backend up and running"}
 
 
+@app.get("/ready")
+def readiness_chk():
+    status=main.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503,content=status)
+
+
 # Email stuff
 @app.get("/emails")
 def all_emails():
@@ -52,7 +70,9 @@ def change_content(email_id:str,updates:dict):
 
 
 @app.post("/email/upload")
-async def ingest_emails(file:UploadFile=File(...)):
+async def ingest_emails(file:UploadFile=File(...),mode:str=Query(email_orch.DEFAULT_INGEST_MODE)):
+    if mode not in email_orch.INGEST_MODES:
+        raise HTTPException(status_code=400,detail=f"Unknown ingest mode:{mode}")
     try:
         if file.content_type not in ["application/json"]:
             raise HTTPException(status_code=400,detail="Invalid File struct. Upload only JSON")
@@ -60,13 +80,21 @@ async def ingest_emails(file:UploadFile=File(...)):
         with tempfile.NamedTemporaryFile(delete=False,suffix=".json") as tmp:
             tmp.write(data)
             temp_path=tmp.name
-        email_orch.ingest_from_json(temp_path)
-        rag_search.build_idx() #type:ignore
-        return {"Status":"200 OK"}
+        # one or two blocking LLM calls per email, kept off the event loop so chat and SSE
+        # streams keep flowing during an upload
+        await run_in_threadpool(email_orch.ingest_from_json,temp_path,mode=mode)
+        from backend.rag import rag_search
+        index_status=rag_search.index_builder.request()
+        return {"Status":"200 OK","index":index_status}
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Ingestion error:{e}")
 
 
+@app.get("/ingest/dedup")
+def dedup_status():
+    return email_orch.dedup_stats()
+
+
 # prompt stuff
 @app.get("/prompts/get_all")
 def get_prompts():
@@ -75,63 +103,154 @@ def get_prompts():
 @app.post("/prompts/change_one")
 def update_prompts(data:dict):
     try:
+        from backend.agent import agent_orch
+        old=sysprompts.load_prompts()
         sysprompts.init_prompt(data)
-        return {"status":"ok"}
+        changed=[k for k in set(old)|set(data) if k!="_id" and old.get(k)!=data.get(k)]
+        dropped=agent_orch.llm_cache.cache.invalidate(changed)
+        return {"status":"ok","changed":changed,"cache_entries_dropped":dropped}
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
 
 
 # RAG Search
 @app.get("/search")
-def ragSearch_emails(q:str):
+def ragSearch_emails(q:str,
+                     snippet_len:int|None=Query(None,ge=0),
+                     mode:str="exhaustive",
+                     category:list[str]|None=Query(None),
+                     sender:list[str]|None=Query(None),
+                     since:str|None=None,
+                     until:str|None=None):
     try:
         from backend.rag import rag_search
-        return rag_search.hybrid_rag(q)
+        if mode not in rag_search.SEARCH_MODES:
+            raise HTTPException(status_code=400,detail=f"Unknown search mode:{mode}")
+        return rag_search.hybrid_rag(q,
+                                     snippet_len=snippet_len,
+                                     mode=mode,
+                                     category=category,
+                                     sender=sender,
+                                     since=since,
+                                     until=until)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400,detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"RAG search error:{e}")
 
 
+@app.post("/index/compact")
+def compact_index():
+    try:
+        from backend.rag import rag_search
+        return {"status":"ok","index":rag_search.index_builder.request(full=True)}
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Index compaction error:{e}")
+
+
+@app.get("/index/status")
+def index_status():
+    from backend.rag import rag_search
+    index=rag_search.index_holder.get()
+    return {"active_version":index.version if index is not None else None,
+            "emails":len(index) if index is not None else 0,
+            "build":rag_search.index_builder.status()}
+
+
 # DeepSeek 7b llm Queries
 
-@app.post("/ds7m/ask")
-def ask(payload:main_orch.AskPayload):
-    from backend.agent.agent_orch import orchestrator
-    
+@app.get("/llm/metrics")
+def llm_metrics():
+    from backend.agent import agent_orch
+    return {**agent_orch.llm_cfg.metrics.snapshot(),"cache":agent_orch.llm_cache.cache.stats()}
+
+
+def ask_context(payload:main_orch.AskPayload)->tuple:
+    # (body,email document); the document lets the orchestrator reuse the category and
+    # actions stored at ingest instead of asking the LLM again
     if payload.email_id:
         email=email_orch.get_email(payload.email_id)
         if not email:
             raise HTTPException(status_code=404,detail="Email not found")
-        return orchestrator(email["body"],payload.question)
+        return email["body"],email
 
     if payload.all_emails:
-        combined_context="\n\n".join([
+        return "\n\n".join([
             f"Subject:{e.get('subject')}\nBody:{e.get('body')}"
             for e in payload.all_emails
-        ])
-        return orchestrator(combined_context,payload.question)
+        ]),None
 
     raise HTTPException(status_code=400,detail="No valid input provided")
 
 
+async def sse(events):
+    # server-sent events, one "event:/data:" frame per (event,data) pair
+    async for event,data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events)->StreamingResponse:
+    return StreamingResponse(sse(events),media_type="text/event-stream",
+                             headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"})
+
+
+# The /ds7m handlers are async: the LLM calls await the shared httpx client, so a
+# generation in flight holds a socket, not a threadpool worker. Mongo reads still go
+# through the threadpool.
+
+@app.post("/ds7m/ask")
+async def ask(payload:main_orch.AskPayload):
+    from backend.agent.agent_orch import orchestrator_async
+    context,email=await run_in_threadpool(ask_context,payload)
+    return await orchestrator_async(context,payload.question,email=email)
+
+
+@app.post("/ds7m/ask/stream")
+async def ask_stream(payload:main_orch.AskPayload):
+    from backend.agent.agent_orch import orchestrator_stream_async
+    context,email=await run_in_threadpool(ask_context,payload)
+    return sse_response(orchestrator_stream_async(context,payload.question,email=email))
+
+
 @app.post("/ds7m/autodraft")
-def resp_draft(email_id:str=Query(...),prompt:str=Query(...)):
-    from backend.agent.agent_orch import autodraft_reply
-    import json
-    email=email_orch.get_email(email_id)
+async def resp_draft(email_id:str=Query(...),prompt:str=Query(...)):
+    from backend.agent.agent_orch import autodraft_reply_async
+    email=await run_in_threadpool(email_orch.get_email,email_id)
     if not email:
         raise HTTPException(status_code=404,detail="Email not found")
-    response=autodraft_reply(email["body"],"Legit",prompt)
+    response=await autodraft_reply_async(email["body"],"Legit",prompt)
     if isinstance(response,str):
         response=json.loads(response)
     draft_text=f"Subject:{response.get('subject')}\n\n{response.get('body')}"
     return {"draft":draft_text}
 
 
+@app.post("/ds7m/autodraft/stream")
+async def resp_draft_stream(email_id:str=Query(...),prompt:str=Query(...)):
+    from backend.agent.agent_orch import autodraft_reply_stream_async
+    from backend.utils import json_parser
+    email=await run_in_threadpool(email_orch.get_email,email_id)
+    if not email:
+        raise HTTPException(status_code=404,detail="Email not found")
+
+    async def events():
+        parts=[]
+        async for chunk in autodraft_reply_stream_async(email["body"],"Legit",prompt):
+            parts.append(chunk)
+            yield "token",chunk
+        response=json_parser.extract_json("".join(parts)) or {}
+        yield "done",{"draft":f"Subject:{response.get('subject')}\n\n{response.get('body')}"}
+
+    return sse_response(events())
+
+
 @app.post("/ds7m/superquery")
-def superquery_api(payload:main_orch.SuperQueryPayload):
-    all_emails=email_orch.get_all_emails()
-    from backend.agent.agent_orch import supersummarizer
-    answer=supersummarizer(payload.question,all_emails)
+async def superquery_api(payload:main_orch.SuperQueryPayload):
+    all_emails=await run_in_threadpool(email_orch.get_all_emails)
+    from backend.agent.agent_orch import supersummarizer_async
+    answer=await supersummarizer_async(payload.question,all_emails)
     return {"answer":answer}
 
 
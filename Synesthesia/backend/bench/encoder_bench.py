@@ -0,0 +1,83 @@
+"""
+Encoder backend benchmark and parity check.
+
+Encodes the same synthetic email bodies with each backend in encoders.ENCODER_BACKENDS
+and reports throughput (texts/s) plus parity with the torch embeddings the index was
+built with: per-text cosine (mean/min) and how often the top-10 nearest neighbours of a
+text agree. Exits non-zero when a backend's min cosine falls below --min-cosine.
+
+Run from the Synesthesia folder:
+    python -m backend.bench.encoder_bench --backends torch onnx onnx-int8 --texts 2000
+"""
+import argparse
+import json
+import sys
+import time
+import numpy as np
+
+from backend.rag.encoders import SentenceEncoder,ENCODER_BACKENDS
+from backend.rag.rag_index import normalize_rows,top_k_rows
+from backend.bench.rag_bench import synth_inbox
+
+
+def throughput(encoder:SentenceEncoder,texts:list)->tuple:
+    encoder.encode(texts[:32])
+    t0=time.perf_counter()
+    emb=encoder.encode(texts)
+    elapsed=time.perf_counter()-t0
+    return normalize_rows(emb),len(texts)/elapsed
+
+
+def neighbour_agreement(ref,emb,k:int=10,n_probe:int=200)->float:
+    hits=0
+    for i in range(min(n_probe,len(ref))):
+        a=set(top_k_rows(ref@ref[i],k+1).tolist())-{i}
+        b=set(top_k_rows(emb@emb[i],k+1).tolist())-{i}
+        hits+=len(a&b)
+    return hits/(k*min(n_probe,len(ref)))
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Compare encoder backends for speed and parity.")
+    parser.add_argument("--backends",nargs="+",default=list(ENCODER_BACKENDS),choices=ENCODER_BACKENDS)
+    parser.add_argument("--model",default="all-MiniLM-L6-v2")
+    parser.add_argument("--texts",type=int,default=2000)
+    parser.add_argument("--min-cosine",type=float,default=0.98)
+    parser.add_argument("--out",default="bench_encoders.json")
+    args=parser.parse_args(argv)
+
+    texts=[e["body"] for e in synth_inbox(args.texts,seed=7)]
+    results={}
+    ref=None
+    failed=[]
+    for backend in ["torch"]+[b for b in args.backends if b!="torch"]:
+        try:
+            encoder=SentenceEncoder(args.model,backend=backend)
+        except ImportError as e:
+            results[backend]={"error":str(e)}
+            print(f"{backend}: skipped ({e})")
+            continue
+        emb,rate=throughput(encoder,texts)
+        res={"texts_per_s":round(rate,1),"dim":int(emb.shape[1])}
+        if ref is None:
+            ref=emb
+        else:
+            cos=np.sum(ref*emb,axis=1)
+            res.update({"cosine_mean":round(float(cos.mean()),5),
+                        "cosine_min":round(float(cos.min()),5),
+                        "top10_agreement":round(neighbour_agreement(ref,emb),4)})
+            if cos.min()<args.min_cosine:
+                failed.append(backend)
+        results[backend]=res
+        print(f"{backend}: {json.dumps(res)}")
+
+    with open(args.out,"w",encoding="utf-8") as f:
+        json.dump({"model":args.model,"n_texts":len(texts),"results":results},f,indent=2)
+    print(f"Results written to {args.out}")
+    for backend in failed:
+        print(f"PARITY FAIL {backend}: min cosine below {args.min_cosine}")
+    return 1 if failed else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
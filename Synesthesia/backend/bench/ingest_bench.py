@@ -0,0 +1,106 @@
+"""
+Ingestion LLM benchmark: two-call vs single-pass triage.
+
+Runs the same emails through email_orch.analyze_email in each ingest mode, against the
+live Ollama model and the active prompts in mongo, and reports emails/minute, LLM calls
+per email and how closely single_pass agrees with the two_call path (category match,
+spam verdict match, task count match, mean Jaccard of the normalized task texts).
+Nothing is written to the Emails collection and the LLM response cache is bypassed, so
+both modes pay for every call.
+
+Run from the Synesthesia folder (needs mongo and ollama up):
+    python -m backend.bench.ingest_bench --input data/email_input.json --workers 3
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+
+# agent_orch imports its helpers as top level `utils.*`
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+
+from backend.db import email_orch
+from backend.agent import agent_orch
+
+
+def run_mode(emails:list,mode:str,workers:int)->tuple:
+    results=[None]*len(emails)
+    t0=time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        future_map={executor.submit(email_orch.analyze_email,e.get("body",""),mode):i
+                    for i,e in enumerate(emails)}
+        for future in concurrent.futures.as_completed(future_map):
+            results[future_map[future]]=future.result()
+    elapsed=time.perf_counter()-t0
+    return results,{
+        "mode":mode,
+        "emails":len(emails),
+        "elapsed_s":round(elapsed,2),
+        "emails_per_min":round(len(emails)*60/elapsed,2) if elapsed else None,
+        "llm_calls_per_email":email_orch.INGEST_MODES[mode],
+    }
+
+
+def task_set(actions:list)->set:
+    texts=[a.get("task","") if isinstance(a,dict) else str(a) for a in actions or []]
+    return {re.sub(r"\W+"," ",t).strip().lower() for t in texts if t}
+
+
+def jaccard(a:set,b:set)->float:
+    if not a and not b: return 1.0
+    return len(a&b)/len(a|b)
+
+
+def agreement(reference:list,candidate:list)->dict:
+    n=len(reference)
+    cat=spam=count=0
+    jac=0.0
+    for (ref_cat,ref_actions),(cand_cat,cand_actions) in zip(reference,candidate):
+        ref_cat,cand_cat=str(ref_cat).strip().lower(),str(cand_cat).strip().lower()
+        cat+=ref_cat==cand_cat
+        spam+=("spam" in ref_cat)==("spam" in cand_cat)
+        count+=len(ref_actions or [])==len(cand_actions or [])
+        jac+=jaccard(task_set(ref_actions),task_set(cand_actions))
+    return {"category_agreement":round(cat/n,4),
+            "spam_agreement":round(spam/n,4),
+            "task_count_agreement":round(count/n,4),
+            "task_jaccard":round(jac/n,4)}
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Benchmark two-call vs single-pass ingestion.")
+    parser.add_argument("--input",default=os.path.join("data","email_input.json"))
+    parser.add_argument("--limit",type=int,default=None)
+    parser.add_argument("--workers",type=int,default=3)
+    parser.add_argument("--out",default="bench_ingest.json")
+    args=parser.parse_args(argv)
+
+    with open(args.input,"r",encoding="utf-8") as f:
+        emails=json.load(f)[:args.limit]
+
+    agent_orch.llm_cache.LLM_CACHE_ENABLED=False
+    outputs,report={},{"created_at":time.strftime("%Y-%m-%dT%H:%M:%SZ",time.gmtime()),
+                       "model":agent_orch.llm_cfg.MODEL_NAME,"workers":args.workers,"modes":[]}
+    for mode in email_orch.INGEST_MODES:
+        outputs[mode],stats=run_mode(emails,mode,args.workers)
+        report["modes"].append(stats)
+        print(json.dumps(stats,indent=2))
+
+    report["single_pass_vs_two_call"]=agreement(outputs["two_call"],outputs["single_pass"])
+    report["per_email"]=[{"id":e.get("id"),
+                          "two_call":{"category":outputs["two_call"][i][0],"tasks":outputs["two_call"][i][1]},
+                          "single_pass":{"category":outputs["single_pass"][i][0],"tasks":outputs["single_pass"][i][1]}}
+                         for i,e in enumerate(emails)]
+    print(json.dumps(report["single_pass_vs_two_call"],indent=2))
+
+    with open(args.out,"w",encoding="utf-8") as f:
+        json.dump(report,f,indent=2)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+Retrieval benchmark for the RAG index.
+
+Generates synthetic inboxes, builds the index with RagIndex.build (no mongo needed), and
+measures build time, index size, per-query latency percentiles and recall@k of every
+search path against exact brute force. When chromadb is installed the HNSW path that
+hybrid_rag uses above RAG_ANN_MIN_DOCS is measured too, on an in-memory collection, and
+the raw recall of chroma's semantic neighbours against brute-force cosine is reported
+with it. Results go to a JSON file; passing --baseline
+compares p95 latencies and recall against an earlier run and exits non-zero on a
+regression, so it can gate a deploy.
+
+Run from the Synesthesia folder:
+    python -m backend.bench.rag_bench --sizes 1000 10000 100000 --out bench_rag.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+from backend.rag.rag_index import RagIndex,HashedTfidf,normalize_rows,top_k_rows
+from backend.rag.ann import ChromaANN
+from backend.rag.snapshot import DiskSnapshotStore
+from backend.rag.encoders import ENCODER_BACKENDS
+
+
+TOPICS={
+    "Meeting":["meeting","calendar","schedule","call","agenda","sync","invite","room","reschedule","standup"],
+    "To-Do":["please","submit","review","deadline","complete","send","prepare","confirm","update","report"],
+    "Newsletter":["weekly","digest","news","industry","subscribe","edition","highlights","trends","market","insights"],
+    "Important":["security","alert","compliance","account","policy","password","access","hr","audit","notice"],
+    "Personal":["dinner","weekend","family","birthday","trip","photos","catch","friends","movie","party"],
+    "Spam":["prize","winner","claim","free","offer","click","urgent","lottery","bonus","gift"],
+}
+FILLER=("the a to of and for in on with this that is be we you your our at by from it as are "
+        "project team build module budget invoice client release build server quarter plan "
+        "data launch design feedback draft version office travel vendor contract").split()
+SENDERS=[f"{name}@{dom}" for name in ("alex","sam","hr","it","news","ceo","kim","ops","noreply","lee")
+         for dom in ("arasaka.corpx","militech.corpx","biotechnica.corpx")]
+
+
+def synth_inbox(n:int,seed:int=0)->list:
+    """
+    Synthetic emails with topic-skewed vocabulary, a lognormal body length (median ~60
+    words, long tail up to ~1500), senders, categories and timestamps spread over a year.
+    """
+    rng=np.random.default_rng(seed)
+    cats=list(TOPICS)
+    lengths=np.clip(rng.lognormal(mean=4.1,sigma=0.7,size=n),8,1500).astype(int)
+    base=int(time.mktime((2077,1,1,0,0,0,0,0,0)))
+    emails=[]
+    for i in range(n):
+        cat=cats[rng.integers(len(cats))]
+        topic=TOPICS[cat]
+        is_topic=rng.random(lengths[i])<0.3
+        words=np.where(is_topic,
+                       rng.choice(topic,size=lengths[i]),
+                       rng.choice(FILLER,size=lengths[i]))
+        emails.append({
+            "id":f"syn_{i:07d}",
+            "sender":SENDERS[rng.integers(len(SENDERS))],
+            "subject":" ".join(rng.choice(topic,size=3)),
+            "timestamp":time.strftime("%Y-%m-%dT%H:%M:%S",time.gmtime(base+int(rng.integers(365*86400)))),
+            "body":" ".join(words.tolist()),
+            "category":cat,
+        })
+    return emails
+
+
+def synth_queries(emails:list,n:int,seed:int=1)->list:
+    rng=np.random.default_rng(seed)
+    queries=[]
+    for _ in range(n):
+        words=emails[rng.integers(len(emails))]["body"].split()
+        start=rng.integers(max(1,len(words)-4))
+        queries.append(" ".join(words[start:start+int(rng.integers(2,6))]))
+    return queries
+
+
+class ProjectionEncoder:
+    """
+    Torch-free stand-in for the sentence encoder: hashed term counts through a fixed
+    random projection. Same output shape and cost profile on the index side, so index
+    build and search timings stay meaningful on machines without the model.
+    """
+    def __init__(self,dim:int=384,seed:int=0):
+        self.tfidf=HashedTfidf(n_features=2**16)
+        self.proj=np.random.default_rng(seed).standard_normal((2**16,dim)).astype(np.float32)
+
+    def __call__(self,texts:list):
+        return np.asarray(self.tfidf.counts(texts)@self.proj,dtype=np.float32)
+
+
+def load_encoder(name:str):
+    if name=="projection":
+        return ProjectionEncoder()
+    if name in ENCODER_BACKENDS:
+        from backend.rag.encoders import SentenceEncoder
+        return SentenceEncoder("all-MiniLM-L6-v2",backend=name).encode
+    raise ValueError(f"Unknown encoder {name!r}")
+
+
+def percentiles(samples_ms:list)->dict:
+    arr=np.asarray(samples_ms,dtype=np.float64)
+    return {"p50_ms":round(float(np.percentile(arr,50)),3),
+            "p95_ms":round(float(np.percentile(arr,95)),3),
+            "p99_ms":round(float(np.percentile(arr,99)),3),
+            "mean_ms":round(float(arr.mean()),3)}
+
+
+def dir_size(path:str)->int:
+    return sum(os.path.getsize(os.path.join(root,f)) for root,_,files in os.walk(path) for f in files)
+
+
+def make_ann(index:RagIndex,ef_search:int):
+    """
+    ChromaANN over an in-memory chroma collection synced from the index, plus the sync
+    time; (None,None) when chromadb is not installed.
+    """
+    try:
+        import chromadb
+    except ImportError:
+        return None,None
+    chroma=chromadb.EphemeralClient()
+    collection=chroma.get_or_create_collection(f"bench_{len(index)}_{time.time_ns()}")
+    ann=ChromaANN(collection,ef_search=ef_search)
+    t0=time.perf_counter()
+    ann.sync(index)
+    return ann,round(time.perf_counter()-t0,3)
+
+
+def semantic_recall(index:RagIndex,ann:ChromaANN,q_embs,k:int)->float:
+    # chroma's top-k neighbours against brute-force cosine over the same embeddings
+    hits=0
+    for i in range(len(q_embs)):
+        truth=set(index.ids[top_k_rows(index.embeddings@q_embs[i],k)].tolist())
+        ids,_=ann.query(q_embs[i:i+1],k)
+        hits+=len(truth&set(ids))
+    return round(hits/(k*len(q_embs)),4)
+
+
+def search_paths(index:RagIndex,top_k:int,shortlist:int,rescore:int,ann=None,ann_candidates:int=200)->dict:
+    """
+    Each search path as fn(q_emb,q_vec,q_text)->list of ids, mirroring hybrid_rag.
+    """
+    def exact(q_emb,q_vec,q_text):
+        return index.search(q_emb,q_vec,top_k=top_k)
+
+    def int8(q_emb,q_vec,q_text):
+        return index.search(q_emb,q_vec,top_k=top_k,rescore=rescore)
+
+    def two_stage(q_emb,q_vec,q_text):
+        rows=index.bm25().candidates(index.vectorizer.counts([q_text]),shortlist)
+        return index.search(q_emb,q_vec,top_k=top_k,rows=rows if len(rows) else None)
+
+    def filtered(q_emb,q_vec,q_text):
+        rows=np.flatnonzero(index.filter_mask(category="Meeting"))
+        return index.search(q_emb,q_vec,top_k=top_k,rows=rows)
+
+    def approx(q_emb,q_vec,q_text):
+        # rag_search.ann_candidates: HNSW neighbours plus the best lexical rows
+        n=max(ann_candidates,top_k)
+        row_of=index.row_of()
+        ids,_=ann.query(q_emb,n)
+        rows={row_of[eid] for eid in ids if eid in row_of}
+        rows.update(top_k_rows(index.lexical_scores(q_vec),n).tolist())
+        return index.search(q_emb,q_vec,top_k=top_k,rows=np.fromiter(rows,dtype=np.int64))
+
+    paths={"exhaustive":exact,"int8_rescore":int8,"two_stage":two_stage,"filtered_category":filtered}
+    if ann is not None:
+        paths["ann"]=approx
+    return paths
+
+
+def run_size(n:int,encoder,n_queries:int,top_k:int,shortlist:int,rescore:int,seed:int,
+             ann_ef:int=100,ann_candidates:int=200)->dict:
+    emails=synth_inbox(n,seed)
+    queries=synth_queries(emails,n_queries,seed+1)
+    result={"n_emails":n,"n_queries":n_queries,"top_k":top_k}
+
+    t0=time.perf_counter()
+    index=RagIndex.build(emails,encoder,version=1)
+    index.quantized()
+    index.bm25()
+    result["build_s"]=round(time.perf_counter()-t0,3)
+
+    arrays=index.to_arrays(derived=True)
+    result["index_bytes"]={
+        "embeddings_f32":int(index.embeddings.nbytes),
+        "embeddings_int8":int(index.quantized().nbytes),
+        "lexical":int(sum(arrays[k].nbytes for k in arrays if k.startswith(("counts_","matrix_")))),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        t0=time.perf_counter()
+        DiskSnapshotStore(tmp).save(index)
+        result["snapshot_write_s"]=round(time.perf_counter()-t0,3)
+        result["index_bytes"]["snapshot_on_disk"]=dir_size(tmp)
+        t0=time.perf_counter()
+        DiskSnapshotStore(tmp).load()
+        result["snapshot_attach_ms"]=round((time.perf_counter()-t0)*1000,3)
+
+    t0=time.perf_counter()
+    q_embs=normalize_rows(encoder(queries))
+    result["query_encode_ms_per_query"]=round((time.perf_counter()-t0)*1000/len(queries),3)
+    q_vecs=[index.vectorizer.transform([q]) for q in queries]
+
+    ann,sync_s=make_ann(index,ann_ef)
+    if ann is None:
+        result["ann"]="skipped, chromadb not installed"
+    else:
+        result["ann"]={"sync_s":sync_s,"ef_search":ann_ef,"ef_applied":ann.ef_applied,"candidates":ann_candidates,
+                       f"semantic_recall@{top_k}":semantic_recall(index,ann,q_embs,top_k)}
+    paths=search_paths(index,top_k,shortlist,rescore,ann,ann_candidates)
+    truth=[[eid for eid,_ in paths["exhaustive"](q_embs[i:i+1],q_vecs[i],q)] for i,q in enumerate(queries)]
+    filtered_truth=[[eid for eid,_ in paths["filtered_category"](q_embs[i:i+1],q_vecs[i],q)] for i,q in enumerate(queries)]
+
+    result["paths"]={}
+    for name,fn in paths.items():
+        lat,hits=[],0
+        ref=filtered_truth if name=="filtered_category" else truth
+        for i,q in enumerate(queries):
+            t0=time.perf_counter()
+            got=fn(q_embs[i:i+1],q_vecs[i],q)
+            lat.append((time.perf_counter()-t0)*1000)
+            hits+=len({eid for eid,_ in got}&set(ref[i]))
+        result["paths"][name]={**percentiles(lat),
+                               f"recall@{top_k}":round(hits/max(1,sum(len(r) for r in ref)),4)}
+    return result
+
+
+def compare(current:dict,baseline:dict,max_slowdown:float,max_recall_drop:float)->list:
+    problems=[]
+    base_by_n={r["n_emails"]:r for r in baseline.get("results",[])}
+    for res in current["results"]:
+        base=base_by_n.get(res["n_emails"])
+        if not base: continue
+        for name,stats in res["paths"].items():
+            old=base["paths"].get(name)
+            if not old: continue
+            if stats["p95_ms"]>old["p95_ms"]*(1+max_slowdown):
+                problems.append(f"n={res['n_emails']} {name}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+            rkey=next(k for k in stats if k.startswith("recall@"))
+            if rkey in old and stats[rkey]<old[rkey]-max_recall_drop:
+                problems.append(f"n={res['n_emails']} {name}: {rkey} {old[rkey]} -> {stats[rkey]}")
+    return problems
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Benchmark RAG index build and search.")
+    parser.add_argument("--sizes",type=int,nargs="+",default=[1000,10000,100000])
+    parser.add_argument("--queries",type=int,default=200)
+    parser.add_argument("--top-k",type=int,default=3)
+    parser.add_argument("--shortlist",type=int,default=300)
+    parser.add_argument("--rescore",type=int,default=100)
+    parser.add_argument("--ann-ef",type=int,default=100,help="chroma ef_search for the ann path")
+    parser.add_argument("--ann-candidates",type=int,default=200)
+    parser.add_argument("--encoder",default="projection",choices=["projection",*ENCODER_BACKENDS])
+    parser.add_argument("--seed",type=int,default=0)
+    parser.add_argument("--out",default="bench_rag.json")
+    parser.add_argument("--baseline",default=None,help="earlier results file to compare against")
+    parser.add_argument("--max-slowdown",type=float,default=0.25,help="allowed relative p95 increase")
+    parser.add_argument("--max-recall-drop",type=float,default=0.02)
+    args=parser.parse_args(argv)
+
+    encoder=load_encoder(args.encoder)
+    report={
+        "created_at":time.strftime("%Y-%m-%dT%H:%M:%SZ",time.gmtime()),
+        "python":platform.python_version(),
+        "numpy":np.__version__,
+        "machine":platform.machine(),
+        "cpus":os.cpu_count(),
+        "encoder":args.encoder,
+        "results":[],
+    }
+    for n in args.sizes:
+        res=run_size(n,encoder,args.queries,args.top_k,args.shortlist,args.rescore,args.seed,
+                     args.ann_ef,args.ann_candidates)
+        report["results"].append(res)
+        print(json.dumps(res,indent=2))
+
+    with open(args.out,"w",encoding="utf-8") as f:
+        json.dump(report,f,indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline,"r",encoding="utf-8") as f:
+            baseline=json.load(f)
+        problems=compare(report,baseline,args.max_slowdown,args.max_recall_drop)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import hashlib
+import re
+import zlib
+import numpy as np
+
+from pymongo import ASCENDING
+
+
+MERSENNE_PRIME=(1<<32)-5
+NUM_PERM=128
+BANDS=16
+SHINGLE=3
+
+
+def tokens(text:str)->list:
+    return re.findall(r"\w+",(text or "").lower())
+
+
+def shingles(words:list,size:int=SHINGLE)->np.ndarray:
+    if len(words)<=size:
+        grams={" ".join(words)}
+    else:
+        grams={" ".join(words[i:i+size]) for i in range(len(words)-size+1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),dtype=np.uint64,count=len(grams))
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles. Each of the num_perm hash functions is
+    (a*x+b) mod p over the crc32 of a shingle; the fraction of equal slots in two
+    signatures estimates the Jaccard similarity of their shingle sets.
+
+    Parameters: -
+    num_perm: signature length
+    seed: fixed seed, so signatures stay comparable across processes and restarts
+    """
+    def __init__(self,num_perm:int=NUM_PERM,seed:int=1):
+        rng=np.random.default_rng(seed)
+        # a<2^31 keeps a*x+b inside uint64 for 32-bit x
+        self.a=rng.integers(1,1<<31,size=num_perm,dtype=np.uint64)
+        self.b=rng.integers(0,1<<31,size=num_perm,dtype=np.uint64)
+        self.num_perm=num_perm
+
+    def signature(self,text:str)->np.ndarray:
+        x=shingles(tokens(text))
+        hashed=(np.outer(x,self.a)+self.b)%MERSENNE_PRIME
+        return hashed.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def similarity(sig_a,sig_b)->float:
+        return float(np.mean(sig_a==sig_b))
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate lookup for ingested emails, LSH-banded MinHash kept in mongo. A
+    signature is split into `bands` bands and each band hash is stored in a multikey
+    indexed array, so a lookup only fetches emails sharing at least one band; those
+    candidates are then checked against `threshold` on the full signature.
+
+    Only emails that finished LLM processing are added, so a match always has a
+    category and actions to reuse.
+
+    Parameters: -
+    collection: mongo collection holding one signature doc per email
+    threshold: estimated Jaccard similarity needed to count as a duplicate
+    min_tokens: shorter bodies are never deduplicated, they are too easy to collide
+    """
+    def __init__(self,collection,threshold:float=0.9,min_tokens:int=20,
+                 num_perm:int=NUM_PERM,bands:int=BANDS):
+        if num_perm%bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.collection=collection
+        self.threshold=threshold
+        self.min_tokens=min_tokens
+        self.bands=bands
+        self.hasher=MinHasher(num_perm)
+        self._indexed=False
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index([("bands",ASCENDING)])
+            self._indexed=True
+
+    def _band_keys(self,sig)->list:
+        rows=len(sig)//self.bands
+        return [f"{i}:{hashlib.blake2b(sig[i*rows:(i+1)*rows].tobytes(),digest_size=8).hexdigest()}"
+                for i in range(self.bands)]
+
+    def signature(self,text:str):
+        """
+        Signature of text, or None when the body is too short to deduplicate.
+        """
+        if len(tokens(text))<self.min_tokens: return None
+        return self.hasher.signature(text)
+
+    def find(self,sig,exclude:str|None=None):
+        """
+        Returns (email_id,similarity) of the closest indexed email at or above the
+        threshold, or None.
+        """
+        if sig is None: return None
+        best=None
+        for doc in self.collection.find({"bands":{"$in":self._band_keys(sig)}},{"sig":1}):
+            if doc["_id"]==exclude: continue
+            sim=self.hasher.similarity(sig,np.frombuffer(doc["sig"],dtype=np.uint32))
+            if sim>=self.threshold and (best is None or sim>best[1]):
+                best=(doc["_id"],sim)
+        return best
+
+    def add(self,email_id:str,sig):
+        if sig is None: return
+        self._ensure_index()
+        self.collection.replace_one({"_id":email_id},
+                                    {"_id":email_id,"bands":self._band_keys(sig),"sig":sig.tobytes()},
+                                    upsert=True)
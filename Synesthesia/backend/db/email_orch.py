@@ -6,14 +6,29 @@ import uuid
 
 from datetime import datetime,timezone
 from pymongo import MongoClient
-from backend.agent.agent_orch import (categorize_email,action_item_extract)
+from backend.agent.agent_orch import (categorize_email,action_item_extract,triage_email,UNPROCESSED_CATEGORIES)
 from backend.utils import json_parser
+from backend.db.dedup import DuplicateIndex
 
 DB_URL=os.getenv("MONGO_URI","mongodb://localhost:27017")
 client=MongoClient(DB_URL)
 db=client["RTTE"]
 Emails=db["Emails"]
 Composed_mails=db["Sent"]
+Stats=db["Stats"]
+
+# emails whose body is a near-duplicate of an already processed one reuse its
+# category and actions instead of going through the two LLM calls again
+DEDUP_ENABLED=os.getenv("DEDUP_ENABLED","1")=="1"
+DEDUP_THRESHOLD=float(os.getenv("DEDUP_THRESHOLD","0.9"))
+DEDUP_MIN_TOKENS=int(os.getenv("DEDUP_MIN_TOKENS","20"))
+
+# two_call: categorize, then extract tasks (the original path)
+# single_pass: one ag_triage call returning category and tasks together
+# value is the number of LLM calls per email in that mode
+INGEST_MODES={"two_call":2,"single_pass":1}
+DEFAULT_INGEST_MODE=os.getenv("INGEST_MODE","two_call")
+dedup_index=DuplicateIndex(db["Dedup_Index"],threshold=DEDUP_THRESHOLD,min_tokens=DEDUP_MIN_TOKENS)
 
 
 def serialize_email(doc):
@@ -59,20 +74,87 @@ def save_raw_email(email:dict):
 def update_email(email_id:str,updates:dict):Emails.update_one({"id":email_id},{"$set":updates})
 
 
-def process_single_email(email:dict):
+def dedup_stats()->dict:
+    doc=Stats.find_one({"_id":"dedup"}) or {}
+    return {"enabled":DEDUP_ENABLED,
+            "threshold":DEDUP_THRESHOLD,
+            "duplicates":doc.get("duplicates",0),
+            "llm_calls_saved":doc.get("llm_calls_saved",0)}
+
+
+def reuse_duplicate(email_id:str,sig,mode:str=DEFAULT_INGEST_MODE):
+    """
+    If the email is a near-duplicate of an already processed one, copies that email's
+    category and actions, links it through duplicate_of and returns the result;
+    otherwise returns None.
+    """
+    match=dedup_index.find(sig,exclude=email_id)
+    if match is None: return None
+    original=Emails.find_one({"id":match[0]},{"category":1,"actions":1})
+    # a failed analysis must not be copied onto its duplicates
+    if not original or original.get("category") in UNPROCESSED_CATEGORIES: return None
+
+    category=original["category"]
+    actions=original.get("actions",[])
+    update_email(
+        email_id=email_id,
+        updates={
+            "category":category,
+            "actions":actions,
+            "duplicate_of":match[0],
+            "duplicate_similarity":round(match[1],4)
+        }
+    )
+    Stats.update_one({"_id":"dedup"},
+                     {"$inc":{"duplicates":1,"llm_calls_saved":INGEST_MODES[mode]}},
+                     upsert=True)
+    return {"id":email_id,"category":category,"actions":actions,"duplicate_of":match[0]}
+
+
+def analyze_email(body:str,
+                  mode:str=DEFAULT_INGEST_MODE):
+    """
+    Category and action items of one email body through the LLM. Returns
+    (category,actions).
+
+    Parameters: -
+    body: email body
+    mode: one of INGEST_MODES
+    """
+    if mode=="single_pass":
+        raw=triage_email(body)
+        parsed=json_parser.extract_json(raw) or {}
+        category=parsed.get("category") or "Uncategorized"
+        actions=parsed.get("tasks") or []
+        # same spam short-circuit as action_item_extract, applied after the call
+        if "spam" in str(category).lower():
+            actions=[]
+        return category,actions
+
+    raw_cat=categorize_email(body)
+    parsed_cat=json_parser.extract_json(raw_cat) or {}
+    category=parsed_cat.get("category","Uncategorized")
+
+    raw_ae=action_item_extract(body,category=category)  
+    parsed_ae=json_parser.extract_json(raw_ae) or {}
+    actions=parsed_ae.get("tasks",[])
+    return category,actions
+
+
+def process_single_email(email:dict,
+                         mode:str=DEFAULT_INGEST_MODE):
     try:
         email_id=email["id"]
         body=email.get("body","")
 
         save_raw_email(email)
 
-        raw_cat=categorize_email(body)
-        parsed_cat=json_parser.extract_json(raw_cat) or {}
-        category=parsed_cat.get("category","Uncategorized")
+        sig=dedup_index.signature(body) if DEDUP_ENABLED else None
+        if sig is not None:
+            reused=reuse_duplicate(email_id,sig,mode)
+            if reused: return reused
 
-        raw_ae=action_item_extract(body,category=category)  
-        parsed_ae=json_parser.extract_json(raw_ae) or {}
-        actions=parsed_ae.get("tasks",[])
+        category,actions=analyze_email(body,mode)
         #print("Email keys:", email.keys())
 
         update_email(
@@ -82,6 +164,8 @@ def process_single_email(email:dict):
                 "actions":actions
             }
         )
+        if category not in UNPROCESSED_CATEGORIES:
+            dedup_index.add(email_id,sig)
         return {"id":email_id,"category":category,"actions":actions}
 
     except Exception as e:
@@ -89,17 +173,20 @@ def process_single_email(email:dict):
 
 
 def ingest_from_json(path:str,
-                     workers:int=3):
+                     workers:int=3,
+                     mode:str=DEFAULT_INGEST_MODE):
 
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found:{path} ref: <email_orch>")
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode:{mode}, expected one of {list(INGEST_MODES)}")
 
     with open(path,"r",encoding="utf-8") as f:
         emails=json.load(f)
 
     results=[]
     with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-        future_map={executor.submit(process_single_email,email):email for email in emails}
+        future_map={executor.submit(process_single_email,email,mode):email for email in emails}
         for future in concurrent.futures.as_completed(future_map):
             res=future.result()
             if res:
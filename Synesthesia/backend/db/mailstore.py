@@ -8,3 +8,43 @@ Emails=db["Emails"]
 
 def get_all_emails():
     return list(Emails.find({}))
+
+SEARCH_FIELDS=("id","sender","subject","timestamp","body","category","actions")
+
+def get_emails_by_ids(ids:list,
+                      fields:tuple=SEARCH_FIELDS,
+                      snippet_len:int|None=None)->list:
+    """
+    Fetches only the given emails with one $in query, projected to `fields`, and returns
+    them in the order of `ids`. ids must be the stored values (RagIndex.id_values); the
+    result is matched back by str(id). When snippet_len is set the body is cut server side.
+    """
+    if not ids: return []
+    if snippet_len is not None and snippet_len<0:
+        raise ValueError(f"snippet_len must be >= 0, got {snippet_len}")
+    projection={f:1 for f in fields}
+    if snippet_len is not None and "body" in projection:
+        projection["body"]={"$substrCP":[{"$ifNull":["$body",""]},0,snippet_len]}
+    found={str(d["id"]):d for d in Emails.find({"id":{"$in":list(ids)}},projection)}
+    return [found[str(eid)] for eid in ids if str(eid) in found]
+
+
+def count_emails()->int:
+    return Emails.count_documents({})
+
+
+def iter_email_batches(batch_size:int=1000,
+                       fields:tuple=("id","sender","timestamp","body","category")):
+    """
+    Streams all emails in stable _id order as lists of at most batch_size docs, so callers
+    never hold the whole collection in memory.
+    """
+    cursor=Emails.find({},{f:1 for f in fields}).sort("_id",1).batch_size(batch_size)
+    batch=[]
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch)>=batch_size:
+            yield batch
+            batch=[]
+    if batch:
+        yield batch
@@ -1,9 +1,50 @@
+import sys
+import threading
+
 from backend.utils import sysprompts
+from backend.utils.logging_cfg import logger
 from pydantic import BaseModel
 
 class Main_Orch:
+    """
+    Owns API startup. Construction does no I/O; warm_up() seeds missing prompts and loads
+    the heavy RAG components (encoder, index, chroma), and is run in a background thread
+    so /health and /emails serve immediately while it works.
+    """
     def __init__(self):
-        sysprompts.init_prompt(sysprompts.prompts)
+        self.components={"prompts":False,"encoder":False,"index":False,"ann":False}
+        self.errors={}
+        self._thread=None
+
+    def start_warm_up(self):
+        if self._thread is None:
+            self._thread=threading.Thread(target=self.warm_up,name="warm-up",daemon=True)
+            self._thread.start()
+
+    def warm_up(self):
+        try:
+            added=sysprompts.seed_prompts(sysprompts.prompts)
+            self.components["prompts"]=True
+            logger.info(f"[STARTUP] Prompts ready, seeded={added}")
+        except Exception as e:
+            self.errors["prompts"]=str(e)
+            logger.error(f"[STARTUP] Prompt seeding failed:{e}",exc_info=True)
+
+        try:
+            from backend.rag import rag_search
+            self.components.update(rag_search.warm_up())
+            logger.info(f"[STARTUP] RAG warm:{self.components}")
+        except Exception as e:
+            self.errors["rag"]=str(e)
+            logger.error(f"[STARTUP] RAG warm-up failed:{e}",exc_info=True)
+
+    def status(self)->dict:
+        # components may also have been loaded lazily by a request since warm-up
+        rag=sys.modules.get("backend.rag.rag_search")
+        if rag is not None:
+            self.components.update(rag.warm_status())
+        ready=all(self.components[c] for c in ("prompts","encoder","index"))
+        return {"ready":ready,"components":dict(self.components),"errors":dict(self.errors)}
 
 class AskPayload(BaseModel):
     email_id:str
@@ -0,0 +1,81 @@
+import numpy as np
+
+from backend.utils.logging_cfg import logger
+
+
+UPSERT_BATCH=4000
+
+
+class ChromaANN:
+    """
+    Approximate nearest-neighbour backend for the semantic side of hybrid_rag, backed by
+    the Chroma (HNSW) `email_index` collection. Entries carry the content hash of the
+    indexed body, so sync() only upserts emails that are new or changed since the last
+    build and deletes the ones that left the index.
+
+    Parameters: -
+    collection: chroma collection
+    ef_search: HNSW search breadth, higher means better recall and slower queries
+    """
+    def __init__(self,collection,ef_search:int=100):
+        self.collection=collection
+        self.ef_search=ef_search
+        self.space=(collection.metadata or {}).get("hnsw:space","l2")
+        self.ef_applied=self._apply_ef()
+
+    def configured_ef(self):
+        config=getattr(self.collection,"configuration",None)
+        hnsw=config.get("hnsw") if isinstance(config,dict) else None
+        return hnsw.get("ef_search") if isinstance(hnsw,dict) else None
+
+    def _apply_ef(self)->bool:
+        # chroma versions without collection configuration reject or ignore the call;
+        # either way queries then run at chroma's default ef, so say so loudly
+        try:
+            self.collection.modify(configuration={"hnsw":{"ef_search":self.ef_search}})
+        except Exception as e:
+            logger.warning(f"[RAG] Could not set chroma ef_search={self.ef_search}, ANN recall may be "
+                           f"lower than configured:{e}")
+            return False
+        configured=self.configured_ef()
+        if configured!=self.ef_search:
+            logger.warning(f"[RAG] chroma reports ef_search={configured} after setting {self.ef_search}, "
+                           f"ANN recall may be lower than configured")
+            return False
+        logger.info(f"[RAG] chroma ef_search={self.ef_search}")
+        return True
+
+    def __len__(self):
+        return self.collection.count()
+
+    def sync(self,index):
+        existing=self.collection.get(include=["metadatas"])
+        have={eid:(meta or {}).get("hash") for eid,meta in zip(existing["ids"],existing["metadatas"])}
+
+        live=set(index.ids.tolist())
+        stale=[eid for eid in have if eid not in live]
+        if stale:
+            self.collection.delete(ids=stale)
+
+        rows=[r for r,(eid,h) in enumerate(zip(index.ids,index.hashes)) if have.get(eid)!=h]
+        for start in range(0,len(rows),UPSERT_BATCH):
+            batch=rows[start:start+UPSERT_BATCH]
+            self.collection.upsert(
+                ids=[str(index.ids[r]) for r in batch],
+                embeddings=np.asarray(index.embeddings[batch],dtype=np.float32).tolist(),
+                metadatas=[{"hash":str(index.hashes[r])} for r in batch])
+        logger.info(f"[RAG] ANN sync: {len(rows)} upserted, {len(stale)} deleted")
+        return len(rows)
+
+    def query(self,q_emb,n:int):
+        """
+        Returns (email_ids,cosine_similarities) of the n approximate nearest neighbours.
+        Embeddings are unit length, so the squared l2 distance chroma reports for the
+        default space converts straight to cosine similarity.
+        """
+        res=self.collection.query(query_embeddings=np.asarray(q_emb,dtype=np.float32).tolist(),
+                                  n_results=n,include=["distances"])
+        ids=res["ids"][0]
+        dist=np.asarray(res["distances"][0],dtype=np.float32)
+        sims=1.0-dist if self.space=="cosine" else 1.0-dist/2.0
+        return ids,sims
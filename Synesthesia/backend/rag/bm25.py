@@ -0,0 +1,52 @@
+import numpy as np
+
+from backend.rag.rag_index import top_k_rows
+
+
+class BM25Index:
+    """
+    Inverted index over the hashed term counts of a RagIndex. The CSC view of the count
+    matrix is exactly a postings list per term, so a query only touches the postings of
+    its own terms, never the whole corpus. Used as the cheap first stage of two-stage
+    retrieval.
+
+    Parameters: -
+    counts: CSR matrix of raw term counts, one row per email
+    k1, b: usual BM25 saturation and length normalization knobs
+    """
+    def __init__(self,counts,k1:float=1.2,b:float=0.75):
+        self.k1=k1
+        self.b=b
+        self.postings=counts.tocsc()
+        self.n_docs=counts.shape[0]
+        doc_len=np.asarray(counts.sum(axis=1),dtype=np.float32).ravel()
+        avg_len=float(doc_len.mean()) if self.n_docs else 1.0
+        # per-document denominator term, precomputed once
+        self.len_norm=(k1*(1-b+b*doc_len/max(avg_len,1e-9))).astype(np.float32)
+        df=np.diff(self.postings.indptr)
+        self.idf=np.log(1+(self.n_docs-df+0.5)/(df+0.5)).astype(np.float32)
+
+    def scores(self,q_counts):
+        """
+        Returns (rows,scores) for every email sharing at least one term with the query.
+        """
+        terms=np.unique(q_counts.indices)
+        rows_parts,score_parts=[],[]
+        for t in terms:
+            start,end=self.postings.indptr[t],self.postings.indptr[t+1]
+            if start==end: continue
+            rows=self.postings.indices[start:end]
+            tf=self.postings.data[start:end].astype(np.float32)
+            rows_parts.append(rows)
+            score_parts.append(self.idf[t]*tf*(self.k1+1)/(tf+self.len_norm[rows]))
+        if not rows_parts:
+            return np.empty(0,dtype=np.int64),np.empty(0,dtype=np.float32)
+
+        rows=np.concatenate(rows_parts)
+        contrib=np.concatenate(score_parts)
+        uniq,inv=np.unique(rows,return_inverse=True)
+        return uniq.astype(np.int64),np.bincount(inv,weights=contrib).astype(np.float32)
+
+    def candidates(self,q_counts,n:int):
+        rows,scores=self.scores(q_counts)
+        return rows[top_k_rows(scores,n)]
@@ -0,0 +1,131 @@
+import multiprocessing as mp
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor,FIRST_COMPLETED,wait
+from scipy import sparse
+from backend.rag.rag_index import RagIndex,HashedTfidf,content_hash,normalize_rows
+from backend.rag.filters import MetaColumns
+from backend.utils.logging_cfg import logger
+
+
+_worker_encoder=None
+
+
+def _init_worker(model_name:str,backend:str,onnx_file,threads:int):
+    global _worker_encoder
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from backend.rag.encoders import SentenceEncoder
+    _worker_encoder=SentenceEncoder(model_name,backend=backend,onnx_file=onnx_file)
+
+
+def _encode_rows(rows,texts:list):
+    return rows,_worker_encoder.encode(texts)
+
+
+class BulkIndexBuild:
+    """
+    Streaming full index build for large backfills. Emails are read from a cursor in
+    batches; bodies are counted in the parent and looked up in the embedding cache, and
+    cache misses fan out to a pool of encoder processes (spawned, one model per process,
+    torch threads split between them). Finished batches are written straight into a
+    float32 memmap at their final rows, so only a few batches of text and vectors are in
+    memory at any time.
+
+    Parameters: -
+    model_name, backend, onnx_file: encoder settings for the worker processes
+    workers: encoder processes, defaults to cpu count
+    cache: EmbeddingCache consulted before encoding, or None
+    max_inflight: batches queued per worker before reading pauses
+    """
+    def __init__(self,model_name:str,backend:str="torch",onnx_file=None,
+                 workers:int|None=None,cache=None,max_inflight:int=2):
+        self.model_name=model_name
+        self.backend=backend
+        self.onnx_file=onnx_file
+        self.workers=workers or os.cpu_count() or 1
+        self.cache=cache
+        self.max_inflight=max_inflight
+
+    def run(self,batches,n_total:int,dim:int,version,emb_path:str,progress)->RagIndex:
+        """
+        Parameters: -
+        batches: iterable of email doc lists (e.g. mailstore.iter_email_batches())
+        n_total: number of emails to index; extra docs arriving mid-build are left for
+        the next incremental update
+        dim: embedding dimension
+        version: version tag for the new index
+        emb_path: scratch file backing the embedding memmap
+        progress: callable(phase,done,total)
+        """
+        emb=np.lib.format.open_memmap(emb_path,mode="w+",dtype=np.float32,shape=(n_total,dim))
+        hasher=HashedTfidf()
+        counts,ids,hashes,meta=[],[],[],[]
+        done=0
+        row=0
+
+        threads=max(1,(os.cpu_count() or 1)//self.workers)
+        ctx=mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers,mp_context=ctx,initializer=_init_worker,
+                                 initargs=(self.model_name,self.backend,self.onnx_file,threads)) as pool:
+            inflight={}
+
+            def collect():
+                nonlocal done
+                finished,_=wait(inflight,return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    keys=inflight.pop(fut)
+                    rows,vecs=fut.result()
+                    vecs=normalize_rows(vecs)
+                    emb[rows]=vecs
+                    if self.cache is not None:
+                        self.cache.put_many(dict(zip(keys,vecs)))
+                    done+=len(rows)
+                    progress("encoding",done,n_total)
+
+            for batch in batches:
+                batch=batch[:n_total-row]
+                if not batch: break
+                texts=[e.get("body") or "" for e in batch]
+                counts.append(hasher.counts(texts))
+                ids.extend(e["id"] for e in batch)
+                hashes.extend(content_hash(t) for t in texts)
+                meta.append(MetaColumns.from_emails(batch))
+
+                rows=np.arange(row,row+len(batch))
+                row+=len(batch)
+                keys=[]
+                if self.cache is not None:
+                    keys=[self.cache.key(t) for t in texts]
+                    cached=self.cache.get_many(list(set(keys)))
+                    hit=np.array([k in cached for k in keys],dtype=bool)
+                    if hit.any():
+                        emb[rows[hit]]=normalize_rows(np.vstack([cached[k] for k,h in zip(keys,hit) if h]))
+                        done+=int(hit.sum())
+                        progress("encoding",done,n_total)
+                        rows=rows[~hit]
+                        texts=[t for t,h in zip(texts,hit) if not h]
+                        keys=[k for k,h in zip(keys,hit) if not h]
+
+                if len(rows):
+                    inflight[pool.submit(_encode_rows,rows,texts)]=keys
+                while len(inflight)>=self.workers*self.max_inflight:
+                    collect()
+                if row>=n_total: break
+
+            while inflight:
+                collect()
+
+        emb.flush()
+        if row<n_total:
+            emb=emb[:row]
+        counts=sparse.vstack(counts,format="csr") if counts else hasher.counts([])
+        logger.info(f"[RAG] Bulk build v{version}: {row} emails, {self.workers} encoder processes")
+        columns=MetaColumns(np.concatenate([m.categories for m in meta]) if meta else [],
+                            np.concatenate([m.senders for m in meta]) if meta else [],
+                            np.concatenate([m.timestamps for m in meta]) if meta else [])
+        return RagIndex(version,counts,emb,ids,hashes,normalized=True,columns=columns)
@@ -0,0 +1,96 @@
+import hashlib
+import re
+import numpy as np
+
+from datetime import datetime,timezone
+from pymongo import ASCENDING,ReplaceOne
+
+
+def normalize_text(text:str)->str:
+    return re.sub(r"\s+"," ",text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in mongo, keyed by (model name, hash of normalized text).
+    Vectors are stored as raw float32 bytes. Once the collection grows past max_entries
+    the least recently used entries are evicted.
+
+    Parameters: -
+    collection: mongo collection backing the cache
+    model_name: encoder name, part of every key so a model swap never serves stale vectors
+    max_entries: size bound for the collection
+    """
+    def __init__(self,collection,model_name:str,max_entries:int=200_000):
+        self.collection=collection
+        self.model_name=model_name
+        self.max_entries=max_entries
+        self._indexed=False
+
+    def key(self,text:str)->str:
+        digest=hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index([("last_used",ASCENDING)])
+            self._indexed=True
+
+    def get_many(self,keys:list)->dict:
+        if not keys: return {}
+        found={}
+        for doc in self.collection.find({"_id":{"$in":keys}},{"dim":1,"vec":1}):
+            found[doc["_id"]]=np.frombuffer(doc["vec"],dtype=np.float32,count=doc["dim"])
+        if found:
+            self.collection.update_many({"_id":{"$in":list(found)}},
+                                        {"$set":{"last_used":datetime.now(timezone.utc)}})
+        return found
+
+    def put_many(self,items:dict):
+        if not items: return
+        self._ensure_index()
+        now=datetime.now(timezone.utc)
+        ops=[]
+        for key,vec in items.items():
+            vec=np.asarray(vec,dtype=np.float32)
+            ops.append(ReplaceOne(
+                {"_id":key},
+                {"_id":key,"model":self.model_name,"dim":int(vec.shape[0]),
+                 "vec":vec.tobytes(),"last_used":now},
+                upsert=True))
+        self.collection.bulk_write(ops,ordered=False)
+        self.evict()
+
+    def evict(self):
+        overflow=self.collection.estimated_document_count()-self.max_entries
+        if overflow<=0: return
+        # trim a little below the bound so eviction doesn't run on every insert
+        n_drop=overflow+self.max_entries//20
+        stale=[d["_id"] for d in self.collection.find({},{"_id":1})
+               .sort("last_used",ASCENDING).limit(n_drop)]
+        self.collection.delete_many({"_id":{"$in":stale}})
+
+    def encode(self,texts:list,encode_fn):
+        """
+        Returns embeddings for texts, calling encode_fn only for texts that are not cached.
+        Duplicate texts within one call are encoded once.
+
+        Parameters: -
+        texts: texts to embed
+        encode_fn: callable mapping a list of texts to an embedding matrix
+        """
+        keys=[self.key(t) for t in texts]
+        cached=self.get_many(list(set(keys)))
+
+        missing={}
+        for k,t in zip(keys,texts):
+            if k not in cached and k not in missing:
+                missing[k]=t
+        if missing:
+            fresh=np.asarray(encode_fn(list(missing.values())),dtype=np.float32)
+            new_items=dict(zip(missing.keys(),fresh))
+            self.put_many(new_items)
+            cached.update(new_items)
+
+        if not keys: return np.empty((0,0),dtype=np.float32)
+        return np.vstack([cached[k] for k in keys])
@@ -0,0 +1,61 @@
+import numpy as np
+
+
+ENCODER_BACKENDS=("torch","onnx","onnx-int8")
+# dynamic int8 export shipped with the all-MiniLM-L6-v2 repo; the avx2 / arm64 variants
+# can be picked with RAG_ONNX_FILE on CPUs without VNNI
+DEFAULT_ONNX_INT8_FILE="onnx/model_qint8_avx512_vnni.onnx"
+
+
+def encoder_id(model_name:str,backend:str)->str:
+    # torch keeps the bare model name so existing cache entries stay valid
+    return model_name if backend=="torch" else f"{model_name}/{backend}"
+
+
+class SentenceEncoder:
+    """
+    Encoder interface used by the RAG module: encode(texts) returns an (n,dim) float32
+    matrix. Every backend runs the same MiniLM model through sentence-transformers, so
+    tokenization, mean pooling and normalization are identical; only the runtime differs.
+
+    - torch:     PyTorch on CPU/GPU (the original path)
+    - onnx:      ONNX Runtime, fp32 graph
+    - onnx-int8: ONNX Runtime, dynamically int8-quantized graph, fastest on CPU
+
+    The onnx backends need the optional `sentence-transformers[onnx]` extra (onnxruntime
+    + optimum). Vectors from different backends are close but not identical, which is why
+    `name` is part of the embedding cache key; compact the index after switching.
+
+    Parameters: -
+    model_name: sentence-transformers model id
+    backend: one of ENCODER_BACKENDS
+    onnx_file: graph file inside the model repo for onnx-int8
+    batch_size: encode batch size
+    """
+    def __init__(self,model_name:str,backend:str="torch",onnx_file:str|None=None,batch_size:int=64):
+        if backend not in ENCODER_BACKENDS:
+            raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {ENCODER_BACKENDS}")
+        self.model_name=model_name
+        self.backend=backend
+        self.batch_size=batch_size
+        self.name=encoder_id(model_name,backend)
+
+        from sentence_transformers import SentenceTransformer
+        if backend=="torch":
+            self.model=SentenceTransformer(model_name)
+        else:
+            try:
+                kwargs={}
+                if backend=="onnx-int8":
+                    kwargs["model_kwargs"]={"file_name":onnx_file or DEFAULT_ONNX_INT8_FILE}
+                self.model=SentenceTransformer(model_name,backend="onnx",**kwargs)
+            except ImportError as e:
+                raise ImportError(f"Encoder backend {backend!r} needs `pip install sentence-transformers[onnx]`:{e}") from e
+
+    @property
+    def dim(self)->int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self,texts:list):
+        return np.asarray(self.model.encode(texts,convert_to_numpy=True,batch_size=self.batch_size),
+                          dtype=np.float32)
@@ -0,0 +1,103 @@
+import numpy as np
+
+from datetime import datetime,timezone
+
+
+NO_TIMESTAMP=-1
+
+
+def to_epoch(value)->int:
+    """
+    Epoch seconds for an ISO timestamp string or datetime; naive values are read as UTC.
+    Missing or unparseable values map to NO_TIMESTAMP.
+    """
+    if value is None or value=="": return NO_TIMESTAMP
+    try:
+        dt=value if isinstance(value,datetime) else datetime.fromisoformat(str(value).replace("Z","+00:00"))
+    except ValueError:
+        return NO_TIMESTAMP
+    if dt.tzinfo is None:
+        dt=dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _bound(value)->int:
+    if isinstance(value,(int,np.integer)): return int(value)
+    ts=to_epoch(value)
+    if ts==NO_TIMESTAMP:
+        raise ValueError(f"Invalid timestamp filter {value!r}")
+    return ts
+
+
+def _norm(value)->str:
+    return str(value or "").strip().lower()
+
+
+class MetaColumns:
+    """
+    Per-row metadata of a RagIndex kept as column arrays, so filters are evaluated as
+    vectorized masks inside the index before any scoring. Category masks are
+    precomputed per distinct value on first use (inboxes only have a handful).
+
+    Parameters: -
+    categories: category per row, "" when the email is not categorized yet
+    senders: lowercased sender per row
+    timestamps: epoch seconds per row, NO_TIMESTAMP when unknown
+    """
+    def __init__(self,categories,senders,timestamps):
+        self.categories=np.asarray(categories,dtype=str)
+        self.senders=np.asarray(senders,dtype=str)
+        self.timestamps=np.asarray(timestamps,dtype=np.int64)
+        self._category_masks=None
+
+    @classmethod
+    def from_emails(cls,emails:list):
+        return cls([_norm(e.get("category")) for e in emails],
+                   [_norm(e.get("sender")) for e in emails],
+                   np.array([to_epoch(e.get("timestamp")) for e in emails],dtype=np.int64))
+
+    @classmethod
+    def empty(cls,n:int):
+        return cls([""]*n,[""]*n,np.full(n,NO_TIMESTAMP,dtype=np.int64))
+
+    def category_masks(self)->dict:
+        if self._category_masks is None:
+            self._category_masks={c:self.categories==c for c in np.unique(self.categories).tolist()}
+        return self._category_masks
+
+    def mask(self,category=None,sender=None,since=None,until=None):
+        """
+        Boolean row mask for the given filters, or None when no filter is set.
+
+        Parameters: -
+        category: one category or a list of them (case-insensitive)
+        sender: one sender or a list of them (case-insensitive, exact)
+        since, until: inclusive timestamp bounds (ISO string, datetime or epoch seconds)
+        """
+        n=len(self.timestamps)
+        mask=None
+
+        if category:
+            wanted=[category] if isinstance(category,str) else category
+            masks=self.category_masks()
+            cat_mask=np.zeros(n,dtype=bool)
+            for c in wanted:
+                m=masks.get(_norm(c))
+                if m is not None: cat_mask|=m
+            mask=cat_mask
+
+        if sender:
+            wanted=[sender] if isinstance(sender,str) else sender
+            sender_mask=np.isin(self.senders,[_norm(s) for s in wanted])
+            mask=sender_mask if mask is None else mask&sender_mask
+
+        if since is not None or until is not None:
+            ts=self.timestamps
+            time_mask=ts!=NO_TIMESTAMP
+            if since is not None:
+                time_mask&=ts>=_bound(since)
+            if until is not None:
+                time_mask&=ts<=_bound(until)
+            mask=time_mask if mask is None else mask&time_mask
+
+        return mask
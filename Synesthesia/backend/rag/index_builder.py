@@ -0,0 +1,111 @@
+import threading
+import time
+import numpy as np
+
+from backend.utils.logging_cfg import logger
+
+
+ENCODE_CHUNK=256
+
+
+class IndexBuilder:
+    """
+    Runs index builds on one background thread so uploads never wait for encoding. A new
+    version is built off to the side and only becomes visible when build_fn publishes it,
+    so searches keep using the last complete version meanwhile. Requests arriving during
+    a build are coalesced into a single follow-up build (full if any of them asked for it).
+
+    Parameters: -
+    build_fn: callable(full:bool,progress:callable)->bool that builds and publishes
+    """
+    def __init__(self,build_fn):
+        self.build_fn=build_fn
+        self._cond=threading.Condition()
+        self._pending=None
+        self._thread=None
+        self._status={
+            "state":"idle",
+            "phase":None,
+            "done":0,
+            "total":0,
+            "full":False,
+            "started_at":None,
+            "finished_at":None,
+            "last_duration_s":None,
+            "last_error":None,
+            "builds":0,
+        }
+
+    def request(self,full:bool=False)->dict:
+        with self._cond:
+            self._pending=full if self._pending is None else (self._pending or full)
+            if self._status["state"]!="building":
+                self._status["state"]="queued"
+            if self._thread is None or not self._thread.is_alive():
+                self._thread=threading.Thread(target=self._run,name="rag-index-builder",daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return dict(self._status)
+
+    def status(self)->dict:
+        with self._cond:
+            status=dict(self._status)
+            status["pending"]=self._pending is not None
+        return status
+
+    def progress(self,phase:str,done:int=0,total:int=0):
+        with self._cond:
+            self._status.update({"phase":phase,"done":done,"total":total})
+
+    def wait(self,timeout:float|None=None)->bool:
+        """
+        Blocks until no build is running or queued. Returns False on timeout.
+        """
+        deadline=None if timeout is None else time.monotonic()+timeout
+        with self._cond:
+            while self._pending is not None or self._status["state"]=="building":
+                remaining=None if deadline is None else deadline-time.monotonic()
+                if remaining is not None and remaining<=0: return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                full=self._pending
+                self._pending=None
+                self._status.update({"state":"building","phase":"starting","done":0,"total":0,
+                                     "full":full,"started_at":time.time(),"last_error":None})
+            started=time.monotonic()
+            try:
+                self.build_fn(full=full,progress=self.progress)
+                error=None
+            except Exception as e:
+                error=str(e)
+                logger.error(f"[RAG] Background index build failed:{e}",exc_info=True)
+
+            with self._cond:
+                self._status.update({
+                    "state":"failed" if error else ("queued" if self._pending is not None else "idle"),
+                    "phase":None,
+                    "finished_at":time.time(),
+                    "last_duration_s":round(time.monotonic()-started,3),
+                    "last_error":error,
+                    "builds":self._status["builds"]+1})
+                self._cond.notify_all()
+
+
+def chunked_encode(encode_fn,progress,chunk:int=ENCODE_CHUNK):
+    """
+    Wraps encode_fn so it encodes in chunks and reports ("encoding",done,total) after each.
+    """
+    def encode(texts:list):
+        parts=[]
+        for start in range(0,len(texts),chunk):
+            parts.append(encode_fn(texts[start:start+chunk]))
+            progress("encoding",min(start+chunk,len(texts)),len(texts))
+        if not parts: return encode_fn(texts)
+        return np.vstack(parts)
+    return encode
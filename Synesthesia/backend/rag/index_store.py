@@ -0,0 +1,135 @@
+import numpy as np
+
+from pymongo import ASCENDING,InsertOne
+from pymongo.errors import DuplicateKeyError
+from backend.rag.rag_index import RagIndex,N_FEATURES
+from backend.utils.logging_cfg import logger
+
+
+INDEX_FORMAT=4
+SEGMENT_BYTES=4*1024*1024
+TEXT_SEP="\n"
+
+
+class MongoIndexStore:
+    """
+    Persists a RagIndex as a small manifest document plus binary segments, so the index is
+    not bounded by mongo's 16 MB document limit. Numeric arrays are written as raw
+    little-endian bytes (embeddings as float32) and id/hash tables as newline separated
+    utf-8 text, each split into segments of at most SEGMENT_BYTES.
+
+    A new version's segments are written first and the manifest is replaced last, so
+    readers either see the old version or the complete new one. The flip only happens
+    while the published version is older than the new one, so a slow build can never
+    replace a newer index. After the flip the replaced version's segments are kept for
+    readers still streaming it; only versions older than both are deleted, which leaves
+    builds still being written by other workers alone.
+
+    Parameters: -
+    manifests: collection holding the {"_id":"rag_store"} manifest
+    segments: collection holding the segment documents
+    """
+    def __init__(self,manifests,segments,segment_bytes:int=SEGMENT_BYTES):
+        self.manifests=manifests
+        self.segments=segments
+        self.segment_bytes=segment_bytes
+        self._indexed=False
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.segments.create_index([("version",ASCENDING),("name",ASCENDING),("seq",ASCENDING)])
+            self._indexed=True
+
+    def published_version(self):
+        doc=self.manifests.find_one({"_id":"rag_store"},{"version":1,"format":1})
+        if not doc or doc.get("format")!=INDEX_FORMAT: return None
+        return doc["version"]
+
+    def _write_bytes(self,version,name:str,view:memoryview)->int:
+        seq=0
+        batch=[]
+        for start in range(0,len(view),self.segment_bytes):
+            batch.append(InsertOne({
+                "_id":f"{version}:{name}:{seq}",
+                "version":version,
+                "name":name,
+                "seq":seq,
+                "data":view[start:start+self.segment_bytes].tobytes()}))
+            seq+=1
+            # flush every few segments so a large array is never buffered twice in full
+            if len(batch)>=4:
+                self.segments.bulk_write(batch,ordered=False)
+                batch=[]
+        if batch:
+            self.segments.bulk_write(batch,ordered=False)
+        return seq
+
+    def _read_into(self,version,name:str,buf:memoryview):
+        offset=0
+        cursor=self.segments.find({"version":version,"name":name},{"data":1}).sort("seq",ASCENDING)
+        for seg in cursor:
+            data=seg["data"]
+            buf[offset:offset+len(data)]=data
+            offset+=len(data)
+        if offset!=len(buf):
+            raise IOError(f"Index segment {name} of v{version} is truncated ({offset}/{len(buf)} bytes)")
+
+    def save(self,index:RagIndex)->bool:
+        """
+        Writes and publishes the index. Returns False, and drops the written segments,
+        when a newer version was published in the meantime.
+        """
+        self._ensure_index()
+        version=index.version
+        arrays=index.to_arrays()
+        layout={}
+        for name,value in arrays.items():
+            if isinstance(value,list):
+                raw=TEXT_SEP.join(value).encode("utf-8")
+                n_seg=self._write_bytes(version,name,memoryview(raw))
+                layout[name]={"kind":"text","nbytes":len(raw),"count":len(value),"segments":n_seg}
+            else:
+                arr=np.ascontiguousarray(value)
+                n_seg=self._write_bytes(version,name,memoryview(arr.reshape(-1).view(np.uint8)))
+                layout[name]={"kind":"array","dtype":arr.dtype.str,"shape":list(arr.shape),
+                              "nbytes":arr.nbytes,"segments":n_seg}
+
+        manifest={"_id":"rag_store",
+                  "format":INDEX_FORMAT,
+                  "version":version,
+                  "n":len(index),
+                  "dim":int(index.embeddings.shape[1]) if index.embeddings.ndim==2 else 0,
+                  "n_features":int(index.counts.shape[1]),
+                  "arrays":layout}
+        replaced=self.manifests.find_one_and_replace(
+            {"_id":"rag_store","$or":[{"version":{"$lt":version}},{"format":{"$ne":INDEX_FORMAT}}]},
+            manifest)
+        if replaced is None:
+            try:
+                self.manifests.insert_one(manifest)
+            except DuplicateKeyError:
+                logger.warning(f"[RAG] Index v{version} not published, a newer version already is")
+                self.segments.delete_many({"version":version})
+                return False
+
+        previous=replaced.get("version") if replaced else None
+        if previous is not None:
+            self.segments.delete_many({"version":{"$lt":min(version,previous)}})
+        return True
+
+    def load(self)->RagIndex|None:
+        manifest=self.manifests.find_one({"_id":"rag_store"})
+        if not manifest or manifest.get("format")!=INDEX_FORMAT: return None
+        version=manifest["version"]
+
+        arrays={}
+        for name,spec in manifest["arrays"].items():
+            if spec["kind"]=="text":
+                buf=bytearray(spec["nbytes"])
+                self._read_into(version,name,memoryview(buf))
+                arrays[name]=buf.decode("utf-8").split(TEXT_SEP) if spec["count"] else []
+            else:
+                arr=np.empty(spec["shape"],dtype=np.dtype(spec["dtype"]))
+                self._read_into(version,name,memoryview(arr.reshape(-1).view(np.uint8)))
+                arrays[name]=arr
+        return RagIndex.from_arrays(version,arrays,manifest.get("n_features",N_FEATURES),normalized=True)
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+BLOCK_ROWS=16384
+
+
+class Int8Embeddings:
+    """
+    Symmetric per-row int8 quantization of the (unit length) embedding matrix: each row is
+    stored as int8 codes plus one float32 scale, 4x smaller than float32. Scores are only
+    approximate, so callers rescore their best candidates against the full precision rows.
+
+    Parameters: -
+    codes: int8 matrix, one row per email
+    scales: float32 per-row scale, row ~= codes*scale
+    """
+    def __init__(self,codes,scales):
+        self.codes=codes
+        self.scales=scales
+
+    @classmethod
+    def quantize(cls,embeddings,block:int=BLOCK_ROWS):
+        n,dim=embeddings.shape if embeddings.ndim==2 else (0,0)
+        codes=np.empty((n,dim),dtype=np.int8)
+        scales=np.empty(n,dtype=np.float32)
+        for start in range(0,n,block):
+            chunk=np.asarray(embeddings[start:start+block],dtype=np.float32)
+            scale=np.abs(chunk).max(axis=1)/127.0
+            scale[scale==0]=1.0
+            codes[start:start+block]=np.rint(chunk/scale[:,None]).astype(np.int8)
+            scales[start:start+block]=scale
+        return cls(codes,scales)
+
+    @property
+    def nbytes(self)->int:
+        return self.codes.nbytes+self.scales.nbytes
+
+    def scores(self,q,rows=None,block:int=BLOCK_ROWS):
+        """
+        Approximate dot products with the normalized query vector q. Codes are widened to
+        float32 one block at a time so the full matrix is never materialized in float32.
+        """
+        codes=self.codes if rows is None else self.codes[rows]
+        scales=self.scales if rows is None else self.scales[rows]
+        out=np.empty(len(codes),dtype=np.float32)
+        for start in range(0,len(codes),block):
+            out[start:start+block]=codes[start:start+block].astype(np.float32)@q
+        return out*scales
@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from backend.utils.logging_cfg import logger
+
+
+class LRUCache:
+    def __init__(self,max_size:int=1024):
+        self.max_size=max_size
+        self._data=OrderedDict()
+        self._lock=threading.Lock()
+
+    def get(self,key):
+        with self._lock:
+            if key not in self._data: return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self,key,value):
+        if self.max_size<=0: return
+        with self._lock:
+            self._data[key]=value
+            self._data.move_to_end(key)
+            while len(self._data)>self.max_size:
+                self._data.popitem(last=False)
+
+
+class QueryBatcher:
+    """
+    Coalesces query embedding requests from concurrent searches. A single worker thread
+    takes the first waiting query, keeps collecting for up to max_wait_ms or until
+    max_batch queries are queued, encodes them in one call and hands each waiter its row.
+    Repeated query strings are answered from an in-process LRU without queueing.
+
+    Parameters: -
+    encode_fn: callable mapping a list of texts to an embedding matrix
+    max_batch: max queries per encode call
+    max_wait_ms: how long the first query of a batch waits for company
+    cache_size: LRU entries for repeated queries, 0 disables it
+    """
+    def __init__(self,encode_fn,max_batch:int=32,max_wait_ms:float=5.0,cache_size:int=1024):
+        self.encode_fn=encode_fn
+        self.max_batch=max_batch
+        self.max_wait_s=max_wait_ms/1000.0
+        self.cache=LRUCache(cache_size)
+        self._queue=queue.Queue()
+        self._worker=None
+        self._start_lock=threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive(): return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker=threading.Thread(target=self._run,name="rag-query-batcher",daemon=True)
+                self._worker.start()
+
+    def encode(self,text:str):
+        """
+        Returns the (1,dim) embedding of text, blocking until its batch is encoded.
+        """
+        hit=self.cache.get(text)
+        if hit is not None: return hit
+
+        fut=Future()
+        self._ensure_worker()
+        self._queue.put((text,fut))
+        return fut.result()
+
+    def _collect(self):
+        batch=[self._queue.get()]
+        deadline=time.monotonic()+self.max_wait_s
+        while len(batch)<self.max_batch:
+            remaining=deadline-time.monotonic()
+            if remaining<=0: break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch=self._collect()
+            texts=list(dict.fromkeys(text for text,_ in batch))
+            try:
+                emb=np.asarray(self.encode_fn(texts),dtype=np.float32)
+                rows={t:emb[i:i+1] for i,t in enumerate(texts)}
+                for t,row in rows.items():
+                    self.cache.put(t,row)
+                for text,fut in batch:
+                    fut.set_result(rows[text])
+            except Exception as e:
+                logger.error(f"[RAG] Query batch of {len(batch)} failed:{e}",exc_info=True)
+                for _,fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
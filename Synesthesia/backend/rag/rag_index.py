@@ -0,0 +1,362 @@
+import hashlib
+import threading
+import time
+import numpy as np
+
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from backend.rag.filters import MetaColumns
+from backend.rag.quant import Int8Embeddings
+from backend.utils.logging_cfg import logger
+
+
+N_FEATURES=2**18
+
+
+def content_hash(text:str)->str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+class HashedTfidf:
+    """
+    TF-IDF over a fixed hashed vocabulary. The hashing step is stateless, so new emails can
+    be turned into term counts without refitting anything; idf is recomputed from the stored
+    count matrix whenever an index is loaded, which is a cheap sparse pass.
+
+    Parameters: -
+    counts: CSR matrix of raw term counts for the indexed corpus
+    """
+    def __init__(self,counts=None,n_features:int=N_FEATURES):
+        self.hasher=HashingVectorizer(stop_words="english",
+                                      n_features=n_features,
+                                      alternate_sign=False,
+                                      norm=None)
+        self.idf=np.ones(n_features,dtype=np.float32)
+        if counts is not None:
+            self.fit(counts)
+
+    def counts(self,texts:list):
+        return self.hasher.transform(texts).tocsr()
+
+    def fit(self,counts):
+        n_docs=counts.shape[0]
+        df=np.bincount(counts.indices,minlength=counts.shape[1])
+        # same smoothed idf TfidfVectorizer uses by default
+        self.idf=(np.log((1+n_docs)/(1+df))+1).astype(np.float32)
+        return self
+
+    def weight(self,counts):
+        weighted=sparse.csr_matrix(counts,dtype=np.float32)@sparse.diags(self.idf)
+        return l2_normalize_csr(weighted)
+
+    def transform(self,texts:list):
+        return self.weight(self.counts(texts))
+
+
+class RagIndex:
+    """
+    Process resident snapshot of the hybrid RAG index. Holds everything hybrid_rag()
+    needs to score a query, so nothing is re-read or deserialized per request.
+
+    Parameters: -
+    version: build version published by build_idx()
+    counts: CSR matrix of hashed term counts, one row per email
+    embeddings: semantic embeddings, one row per email
+    ids: email ids, aligned with the rows of counts and embeddings; kept as strings, the
+    original values are recovered with id_values()
+    hashes: content hash of each indexed body, used to spot changed emails
+    matrix, idf: precomputed weighted TF-IDF matrix and idf, e.g. from a disk snapshot
+    normalized: embeddings are already L2-normalized float32 and are used as given
+    columns: MetaColumns (category, sender, timestamp) used for filtered search
+    quantized: precomputed Int8Embeddings of the embeddings, built lazily otherwise
+    id_ints: per row, whether the mongo id is an int; derived from ids when not given
+    """
+    def __init__(self,version,counts,embeddings,ids,hashes,
+                 matrix=None,idf=None,normalized:bool=False,columns:MetaColumns|None=None,
+                 quantized:Int8Embeddings|None=None,id_ints=None):
+        self.version=version
+        self.counts=counts if sparse.isspmatrix_csr(counts) else sparse.csr_matrix(counts)
+        self.vectorizer=HashedTfidf(n_features=self.counts.shape[1])
+        if idf is None:
+            self.vectorizer.fit(self.counts)
+        else:
+            self.vectorizer.idf=idf
+        self.matrix=matrix if matrix is not None else self.vectorizer.weight(self.counts)
+        self.embeddings=embeddings if normalized else normalize_rows(embeddings)
+        self.id_ints=np.asarray(id_ints,dtype=bool) if id_ints is not None else int_id_mask(ids)
+        self.ids=as_str_array(ids)
+        self.hashes=as_str_array(hashes)
+        self.columns=columns if columns is not None else MetaColumns.empty(len(self.ids))
+        self._quantized=quantized
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self)->dict:
+        if getattr(self,"_row_of",None) is None:
+            self._row_of={eid:i for i,eid in enumerate(self.ids.tolist())}
+        return self._row_of
+
+    def id_values(self,ids:list)->list:
+        """
+        The given index ids as stored in mongo, e.g. 5 rather than "5" for numeric ids
+        from an uploaded JSON, so they can be matched with an $in query.
+        """
+        if not self.id_ints.any(): return [str(eid) for eid in ids]
+        row_of=self.row_of()
+        return [int(eid) if self.id_ints[row_of[str(eid)]] else str(eid) for eid in ids]
+
+    def filter_mask(self,**filters):
+        return self.columns.mask(**filters)
+
+    def bm25(self):
+        if getattr(self,"_bm25",None) is None:
+            from backend.rag.bm25 import BM25Index
+            self._bm25=BM25Index(self.counts)
+        return self._bm25
+
+    def quantized(self)->Int8Embeddings:
+        if self._quantized is None:
+            self._quantized=Int8Embeddings.quantize(self.embeddings)
+        return self._quantized
+
+    def semantic_scores(self,q_emb,rows=None,approx:bool=False):
+        q=normalize_rows(q_emb)[0]
+        if approx:
+            return self.quantized().scores(q,rows)
+        emb=self.embeddings if rows is None else self.embeddings[rows]
+        return emb@q
+
+    def lexical_scores(self,q_vec,rows=None):
+        # TF-IDF rows and the query vector are both L2-normalized by the vectorizer,
+        # so one sparse product gives the cosine similarity against every email.
+        mat=self.matrix if rows is None else self.matrix[rows]
+        return (mat@q_vec.T).toarray().astype(np.float32).ravel()
+
+    def score(self,q_emb,q_vec,semantic_wt:float,lexical_wt:float,rows=None,approx:bool=False):
+        scores=semantic_wt*self.semantic_scores(q_emb,rows,approx)
+        if lexical_wt:
+            scores+=lexical_wt*self.lexical_scores(q_vec,rows)
+        return scores
+
+    def search(self,q_emb,q_vec,top_k:int=3,semantic_wt:float=0.75,lexical_wt:float=0.25,
+               rows=None,rescore:int|None=None):
+        """
+        Scores the whole corpus (or only `rows`, when a candidate set is given) with one
+        dense matmul and one sparse product, then selects the top_k rows with a partial
+        selection instead of a full sort.
+
+        With rescore=N the semantic side is first scored on the int8 codes, and only the
+        best N rows are rescored against the full precision embeddings.
+
+        Returns: list of (email_id,score) in descending score order.
+        """
+        if rows is not None:
+            rows=np.asarray(rows)
+        if rescore:
+            approx=self.score(q_emb,q_vec,semantic_wt,lexical_wt,rows,approx=True)
+            cand=top_k_rows(approx,max(rescore,top_k))
+            rows=cand if rows is None else rows[cand]
+
+        scores=self.score(q_emb,q_vec,semantic_wt,lexical_wt,rows)
+        top=top_k_rows(scores,top_k)
+        picked=top if rows is None else rows[top]
+        return [(self.ids[r],float(scores[t])) for r,t in zip(picked,top)]
+
+    @classmethod
+    def build(cls,emails:list,encode,version):
+        """
+        Full build from scratch: every body is counted and encoded.
+
+        Parameters: -
+        emails: email docs with "id" and "body"
+        encode: callable mapping a list of texts to an embedding matrix
+        version: version tag for the new index
+        """
+        ids=[e["id"] for e in emails]
+        docs=[e.get("body") or "" for e in emails]
+        counts=HashedTfidf().counts(docs)
+        embeddings=encode(docs)
+        return cls(version,counts,embeddings,ids,[content_hash(d) for d in docs],
+                   columns=MetaColumns.from_emails(emails))
+
+    def updated(self,emails:list,encode,version):
+        """
+        Incremental build on top of this index. Rows whose id and content hash are unchanged
+        are carried over; only new or edited bodies are counted and encoded, and emails no
+        longer present are dropped. Returns (new_index,n_encoded).
+
+        Parameters: -
+        emails: the current full list of email docs
+        encode: callable mapping a list of texts to an embedding matrix
+        version: version tag for the new index
+        """
+        row_of=self.row_of()
+        keep_rows,keep_emails=[],[]
+        fresh_emails,fresh_docs=[],[]
+        for e in emails:
+            body=e.get("body") or ""
+            row=row_of.get(str(e["id"]))
+            if row is not None and self.hashes[row]==content_hash(body):
+                keep_rows.append(row)
+                keep_emails.append(e)
+            else:
+                fresh_emails.append(e)
+                fresh_docs.append(body)
+
+        keep_rows=np.asarray(keep_rows,dtype=np.int64)
+        counts=self.counts[keep_rows]
+        embeddings=self.embeddings[keep_rows]
+        hashes=self.hashes[keep_rows].tolist()
+        if fresh_docs:
+            counts=sparse.vstack([counts,self.vectorizer.counts(fresh_docs)],format="csr")
+            embeddings=np.vstack([embeddings,normalize_rows(encode(fresh_docs))])
+            hashes+=[content_hash(d) for d in fresh_docs]
+        # metadata is cheap and may change without the body changing (e.g. category
+        # assigned after ingestion), so columns are always rebuilt from the current docs
+        ordered=keep_emails+fresh_emails
+        index=RagIndex(version,counts,embeddings,[e["id"] for e in ordered],hashes,
+                       normalized=True,columns=MetaColumns.from_emails(ordered))
+        return index,len(fresh_docs)
+
+    def to_arrays(self,derived:bool=False)->dict:
+        """
+        Flat dict of arrays describing the index. derived=True also includes the weighted
+        TF-IDF matrix and idf, which a loader can then use as-is instead of recomputing.
+        """
+        arrays={
+            "embeddings":self.embeddings,
+            "counts_data":self.counts.data.astype(np.float32,copy=False),
+            "counts_indices":self.counts.indices,
+            "counts_indptr":self.counts.indptr,
+            "ids":self.ids.tolist(),
+            "id_ints":self.id_ints,
+            "hashes":self.hashes.tolist(),
+            "categories":self.columns.categories.tolist(),
+            "senders":self.columns.senders.tolist(),
+            "timestamps":self.columns.timestamps,
+        }
+        if derived:
+            arrays.update({
+                "matrix_data":self.matrix.data.astype(np.float32,copy=False),
+                "matrix_indices":self.matrix.indices,
+                "matrix_indptr":self.matrix.indptr,
+                "idf":self.vectorizer.idf,
+                "emb_codes":self.quantized().codes,
+                "emb_scales":self.quantized().scales,
+            })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls,version,arrays:dict,n_features:int=N_FEATURES,normalized:bool=False):
+        n=len(arrays["ids"])
+        counts=sparse.csr_matrix(
+            (arrays["counts_data"],arrays["counts_indices"],arrays["counts_indptr"]),
+            shape=(n,n_features))
+        matrix=None
+        if "matrix_data" in arrays:
+            matrix=sparse.csr_matrix(
+                (arrays["matrix_data"],arrays["matrix_indices"],arrays["matrix_indptr"]),
+                shape=(n,n_features))
+        columns=None
+        if "timestamps" in arrays:
+            columns=MetaColumns(arrays["categories"],arrays["senders"],arrays["timestamps"])
+        quantized=None
+        if "emb_codes" in arrays:
+            quantized=Int8Embeddings(arrays["emb_codes"],arrays["emb_scales"])
+        return cls(version,counts,arrays["embeddings"],arrays["ids"],arrays["hashes"],
+                   matrix=matrix,idf=arrays.get("idf"),normalized=normalized,columns=columns,
+                   quantized=quantized,id_ints=arrays.get("id_ints"))
+
+
+def int_id_mask(values):
+    if isinstance(values,np.ndarray) and values.dtype.kind=="U":
+        return np.zeros(len(values),dtype=bool)
+    return np.fromiter((isinstance(v,int) and not isinstance(v,bool) for v in values),
+                       dtype=bool,count=len(values))
+
+
+def as_str_array(values):
+    if isinstance(values,np.ndarray) and values.dtype.kind=="U":
+        return values
+    return np.array(list(values),dtype=str)
+
+
+def normalize_rows(mat):
+    mat=np.asarray(mat,dtype=np.float32)
+    if mat.ndim==1:
+        mat=mat.reshape(1,-1)
+    norms=np.linalg.norm(mat,axis=1,keepdims=True)
+    norms[norms==0]=1.0
+    return mat/norms
+
+
+def l2_normalize_csr(mat):
+    mat=sparse.csr_matrix(mat)
+    norms=np.sqrt(np.asarray(mat.multiply(mat).sum(axis=1)).ravel())
+    norms[norms==0]=1.0
+    return sparse.diags((1.0/norms).astype(np.float32))@mat
+
+
+def top_k_rows(scores,k:int):
+    n=len(scores)
+    if n==0 or k<=0: return np.empty(0,dtype=np.int64)
+    if k>=n:
+        return np.argsort(-scores,kind="stable")
+    part=np.argpartition(-scores,k-1)[:k]
+    return part[np.argsort(-scores[part],kind="stable")]
+
+
+class IndexHolder:
+    """
+    Keeps one RagIndex resident for the process and reloads it only when a newer version
+    has been published. The published version is polled at most every `poll_s` seconds,
+    and the check only reads the manifest, never the index payload itself.
+
+    Parameters: -
+    store: index store exposing published_version() and load()
+    poll_s: min seconds between version checks
+    """
+    def __init__(self,store,poll_s:float=2.0):
+        self.store=store
+        self.poll_s=poll_s
+        self._index=None
+        self._published=None
+        self._checked_at=0.0
+        self._lock=threading.Lock()
+
+    @property
+    def loaded(self)->bool:
+        return self._index is not None
+
+    @property
+    def empty(self)->bool:
+        # the last check found no published version at all, as opposed to a failed load
+        return self._checked_at>0 and self._published is None
+
+    def publish(self,index:RagIndex):
+        with self._lock:
+            self._index=index
+            self._published=index.version
+            self._checked_at=time.monotonic()
+
+    def get(self)->RagIndex|None:
+        now=time.monotonic()
+        if self._index is not None and now-self._checked_at<self.poll_s:
+            return self._index
+
+        with self._lock:
+            if self._index is not None and now-self._checked_at<self.poll_s:
+                return self._index
+            version=self.store.published_version()
+            self._published=version
+            self._checked_at=time.monotonic()
+            if version is None:
+                self._index=None
+            elif self._index is None or self._index.version!=version:
+                try:
+                    self._index=self.store.load() or self._index
+                except Exception as e:
+                    # keep serving the last complete version, retry on the next poll
+                    logger.error(f"[RAG] Loading index v{version} failed:{e}",exc_info=True)
+            return self._index
@@ -1,71 +1,277 @@
 import os
-import pickle
-import io
+import threading
+import time
 import numpy as np
 
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy import sparse
 from backend.db import mailstore
-from chromadb import PersistentClient
+from backend.utils.logging_cfg import logger
+from backend.rag.rag_index import RagIndex,IndexHolder,top_k_rows
+from backend.rag.index_store import MongoIndexStore
+from backend.rag.snapshot import DiskSnapshotStore,SnapshotBackedStore
+from backend.rag.embed_cache import EmbeddingCache
+from backend.rag.ann import ChromaANN
+from backend.rag.query_batcher import QueryBatcher
+from backend.rag.index_builder import IndexBuilder,chunked_encode
+from backend.rag.encoders import SentenceEncoder,encoder_id
+from backend.rag.bulk_build import BulkIndexBuild
 
 
 VectorDB=os.path.join(os.path.dirname(__file__),"rag_store")
 Parent_dir=os.path.join(os.path.dirname(__file__),"..","rag_store")
 
 CHROMA_DIR=os.path.join(VectorDB,"chromadb")
-TFIDF_VECT=os.path.join(VectorDB,"vectorizer.joblib")
-TFIDF_MAT=os.path.join(VectorDB,"matrix.npz")
-TFIDF_IDS=os.path.join(VectorDB,"ids.json")
+SNAPSHOT_DIR=os.getenv("RAG_SNAPSHOT_DIR",os.path.join(VectorDB,"snapshots"))
 
-client=PersistentClient(path=VectorDB)
-email_idx=client.get_or_create_collection("email_index")
+ANN_MIN_DOCS=int(os.getenv("RAG_ANN_MIN_DOCS","20000"))
+ANN_EF=int(os.getenv("RAG_ANN_EF","100"))
+ANN_CANDIDATES=int(os.getenv("RAG_ANN_CANDIDATES","200"))
+SHORTLIST_SIZE=int(os.getenv("RAG_SHORTLIST_SIZE","300"))
+SEARCH_MODES=("exhaustive","two_stage")
 
-_embed_model=SentenceTransformer("all-MiniLM-L6-v2")
+# "int8" scores the semantic side on quantized codes and rescores the best
+# RAG_RESCORE_N rows at full precision; "none" scores full precision throughout
+QUANTIZE=os.getenv("RAG_QUANTIZE","none")
+RESCORE_N=int(os.getenv("RAG_RESCORE_N","100"))
+
+EMBED_MODEL="all-MiniLM-L6-v2"
+# torch | onnx | onnx-int8, see encoders.SentenceEncoder
+ENCODER_BACKEND=os.getenv("RAG_ENCODER","torch")
+ONNX_FILE=os.getenv("RAG_ONNX_FILE") or None
 
 DB_URL=os.getenv("MONGO_URI","mongodb://localhost:27017")
 client=MongoClient(DB_URL)
 db=client["RTTE"]
 RAG=db["RAG_Vectors"]
 
-def build_idx():
+INDEX_POLL_S=float(os.getenv("RAG_INDEX_POLL_S","2"))
+index_store=SnapshotBackedStore(MongoIndexStore(RAG,db["RAG_Segments"]),DiskSnapshotStore(SNAPSHOT_DIR))
+index_holder=IndexHolder(index_store,poll_s=INDEX_POLL_S)
+
+# full builds of at least RAG_BULK_MIN_DOCS emails stream from mongo and encode on a
+# process pool instead of loading the whole corpus into this process
+BULK_MIN_DOCS=int(os.getenv("RAG_BULK_MIN_DOCS","50000"))
+BULK_WORKERS=int(os.getenv("RAG_BULK_WORKERS","0")) or None
+BULK_BATCH=int(os.getenv("RAG_BULK_BATCH","1000"))
+
+EMBED_CACHE_MAX=int(os.getenv("RAG_EMBED_CACHE_MAX","200000"))
+embed_cache=EmbeddingCache(db["Embed_Cache"],encoder_id(EMBED_MODEL,ENCODER_BACKEND),max_entries=EMBED_CACHE_MAX)
+
+# The encoder (torch) and chroma are the slow parts of importing this module, so both
+# are created on first use or by warm_up(), never at import time.
+_embed_model=None
+_embed_lock=threading.Lock()
+_ann=None
+_ann_lock=threading.Lock()
+_ann_version=None
+
+
+def get_embed_model()->SentenceEncoder:
+    global _embed_model
+    if _embed_model is None:
+        with _embed_lock:
+            if _embed_model is None:
+                _embed_model=SentenceEncoder(EMBED_MODEL,backend=ENCODER_BACKEND,onnx_file=ONNX_FILE)
+                logger.info(f"[RAG] Encoder loaded:{_embed_model.name}")
+    return _embed_model
+
+
+def get_ann()->ChromaANN:
+    global _ann
+    if _ann is None:
+        with _ann_lock:
+            if _ann is None:
+                from chromadb import PersistentClient
+                chroma=PersistentClient(path=VectorDB)
+                _ann=ChromaANN(chroma.get_or_create_collection("email_index"),ef_search=ANN_EF)
+    return _ann
+
+
+def warm_status()->dict:
+    # the index is warm once it is resident; an inbox with nothing published and no build
+    # queued counts too, but a failed load or a pending first build does not
+    build=index_builder.status()
+    building=build["pending"] or build["state"] in ("queued","building")
+    return {"encoder":_embed_model is not None,
+            "index":index_holder.loaded or (index_holder.empty and not building),
+            "ann":_ann is not None}
+
+
+def warm_up():
+    """
+    Loads the encoder and the resident index, plus chroma when the index is large enough
+    to use ANN. When mongo holds emails but no index in the current format (a fresh
+    deployment, or a store written by an older version) a full build is queued, since
+    search would otherwise return nothing until the next upload or /index/compact.
+    Meant to run in a background thread right after the API starts.
+    """
+    get_embed_model()
+    index=index_holder.get()
+    if index is None and index_store.published_version() is None and mailstore.count_emails():
+        logger.info("[RAG] No index in the current format, queueing a full build")
+        index_builder.request(full=True)
+    if index is not None and len(index)>=ANN_MIN_DOCS:
+        get_ann()
+    return warm_status()
+
+
+def _encode_raw(texts:list):
+    return get_embed_model().encode(texts)
+
+
+def encode_texts(texts:list):
+    return embed_cache.encode(texts,_encode_raw)
+
+
+QUERY_BATCH_MAX=int(os.getenv("RAG_QUERY_BATCH_MAX","32"))
+QUERY_BATCH_WAIT_MS=float(os.getenv("RAG_QUERY_BATCH_WAIT_MS","5"))
+QUERY_CACHE_SIZE=int(os.getenv("RAG_QUERY_CACHE_SIZE","1024"))
+query_batcher=QueryBatcher(encode_texts,
+                           max_batch=QUERY_BATCH_MAX,
+                           max_wait_ms=QUERY_BATCH_WAIT_MS,
+                           cache_size=QUERY_CACHE_SIZE)
+
+
+def _no_progress(phase:str,done:int=0,total:int=0):
+    pass
+
+
+def build_idx(full:bool=False,progress=_no_progress):
+    """
+    Publishes a new index version. By default this is incremental: the current index is
+    reused and only new or edited emails are encoded. full=True re-encodes the whole
+    corpus and is the explicit compaction path.
+
+    This runs synchronously; the API goes through index_builder, which calls it on a
+    background thread.
+
+    Parameters: -
+    full: force a full rebuild instead of an incremental update
+    progress: callable(phase,done,total) for build status reporting
+    """
+    current=None if full else index_holder.get()
+    # a full rebuild, or the very first build, of a large inbox takes the streaming path
+    if current is None and mailstore.count_emails()>=BULK_MIN_DOCS:
+        return build_idx_bulk(progress=progress)
+
+    progress("loading")
     emails=mailstore.get_all_emails()
-    if not emails: return False 
-
-    ids=[e["id"] for e in emails]
-    docs=[e.get("body","") for e in emails]
-
-
-    syn_vector=TfidfVectorizer(stop_words="english",max_features=20000)
-    syn_matrix=syn_vector.fit_transform(docs)
-    
-    vec_BLOB=pickle.dumps(syn_vector)
-
-    matrix_buffer=io.BytesIO()
-    sparse.save_npz(matrix_buffer,syn_matrix)
-    matrix_bytes=matrix_buffer.getvalue()
-    sem_emb=_embed_model.encode(docs,convert_to_numpy=True)
-
-    emb_list=[
-        {"email_id": eid, "embedding": emb.tolist()}
-        for eid,emb in zip(ids,sem_emb)
-    ]
-    RAG.replace_one(
-        {"_id": "rag_store"},
-        {
-            "_id": "rag_store",
-            "vectorizer": vec_BLOB,
-            "matrix": matrix_bytes,
-            "ids": ids,
-            "embeddings": emb_list,
-        },
-        upsert=True)
-    
+    if not emails: return False
+
+    version=time.time_ns()
+    encode=chunked_encode(encode_texts,progress)
+    if current is None:
+        index=RagIndex.build(emails,encode,version)
+        n_encoded=len(index)
+    else:
+        index,n_encoded=current.updated(emails,encode,version)
+
+    progress("saving",len(index),len(index))
+    index_store.save(index)
+    # saving caches the derived int8 rows on the in-memory index; the snapshot copy is
+    # memory mapped, so publishing it keeps neither float32 nor int8 rows on the heap
+    index=index_store.load() or index
+    index_holder.publish(index)
+    if len(index)>=ANN_MIN_DOCS:
+        progress("ann_sync",0,len(index))
+        sync_ann(index)
+    logger.info(f"[RAG] Published index v{version}: {len(index)} emails, {n_encoded} encoded, full={full or current is None}")
+    return True
+
+
+def build_idx_bulk(workers:int|None=BULK_WORKERS,batch_size:int=BULK_BATCH,progress=_no_progress):
+    """
+    Full rebuild for large corpora. Emails are streamed from mongo in batches, cache
+    misses are encoded on `workers` processes and vectors land in a memmap under
+    SNAPSHOT_DIR as batches finish, so peak memory is a few batches plus the lexical
+    counts. The published index is re-attached from the disk snapshot before the
+    scratch file is removed.
+
+    Parameters: -
+    workers: encoder processes, cpu count when None
+    batch_size: emails per cursor batch and per encode task
+    progress: callable(phase,done,total) for build status reporting
+    """
+    n_total=mailstore.count_emails()
+    if not n_total: return False
+
+    version=time.time_ns()
+    os.makedirs(SNAPSHOT_DIR,exist_ok=True)
+    emb_path=os.path.join(SNAPSHOT_DIR,f"bulk_{version}.npy")
+    builder=BulkIndexBuild(EMBED_MODEL,backend=ENCODER_BACKEND,onnx_file=ONNX_FILE,
+                           workers=workers,cache=embed_cache)
+    try:
+        progress("encoding",0,n_total)
+        index=builder.run(mailstore.iter_email_batches(batch_size),n_total,get_embed_model().dim,
+                          version,emb_path,progress)
+        progress("saving",len(index),len(index))
+        index_store.save(index)
+        index=index_store.load() or index
+        index_holder.publish(index)
+    finally:
+        if os.path.exists(emb_path):
+            os.remove(emb_path)
+
+    if len(index)>=ANN_MIN_DOCS:
+        progress("ann_sync",0,len(index))
+        sync_ann(index)
+    logger.info(f"[RAG] Published index v{version}: {len(index)} emails, bulk build with {builder.workers} workers")
     return True
 
 
+def compact_idx():
+    return build_idx(full=True)
+
+
+index_builder=IndexBuilder(build_idx)
+
+
+def sync_ann(index:RagIndex):
+    global _ann_version
+    get_ann().sync(index)
+    _ann_version=index.version
+
+
+def ann_ready(index:RagIndex)->bool:
+    """
+    ANN is only used above ANN_MIN_DOCS and once the chroma collection is known to match
+    the resident index version; otherwise search falls back to exact brute force.
+    """
+    global _ann_version
+    if len(index)<ANN_MIN_DOCS: return False
+    if _ann_version!=index.version:
+        if len(get_ann())!=len(index):
+            return False
+        _ann_version=index.version
+    return True
+
+
+def ann_candidates(index:RagIndex,q_emb,q_vec,top_k:int):
+    # semantic neighbours from HNSW, plus the best lexical rows so strong keyword hits
+    # that sit outside the semantic neighbourhood still reach the fused scoring.
+    n=max(ANN_CANDIDATES,top_k)
+    row_of=index.row_of()
+    ann_ids,_=get_ann().query(q_emb,n)
+    rows={row_of[eid] for eid in ann_ids if eid in row_of}
+    rows.update(top_k_rows(index.lexical_scores(q_vec),n).tolist())
+    return np.fromiter(rows,dtype=np.int64)
+
+
+def shortlist_candidates(index:RagIndex,query:str,top_k:int):
+    # BM25 over the inverted index; None means no term overlap and the caller should
+    # fall back to exhaustive scoring rather than return nothing.
+    rows=index.bm25().candidates(index.vectorizer.counts([query]),max(SHORTLIST_SIZE,top_k))
+    return rows if len(rows) else None
+
+
+def restrict(rows,mask,min_rows:int):
+    # keep only candidate rows that pass the filter; too few survivors means the
+    # candidate stage was too narrow for this filter and the caller falls back
+    if rows is None or mask is None: return rows
+    rows=rows[mask[rows]]
+    return rows if len(rows)>=min_rows else None
+
+
 def clean_email(doc):
     if "_id" in doc:
         doc["_id"]=str(doc["_id"])
@@ -75,37 +281,55 @@ def clean_email(doc):
 def hybrid_rag(query:str, 
                top_k=3, 
                semantic_wt=0.75, 
-               lexical_wt=0.25):
-
-    meta=RAG.find_one({"_id":"rag_store"})
-    if not meta: return []
-    
-    syn_vec=pickle.loads(meta["vectorizer"])
-
-    buf=io.BytesIO(meta["matrix"])
-    syn_matrix=sparse.load_npz(buf)
-
-    ids=meta["ids"]
-
-    emb_map={
-        e["email_id"]:np.array(e["embedding"])
-        for e in meta["embeddings"]
-        }
-
-    q_emb=_embed_model.encode([query],convert_to_numpy=True)[0]
-    sem_scores={
-        eid: float(np.dot(q_emb,emb)/(np.linalg.norm(q_emb)*np.linalg.norm(emb)))
-        for eid, emb in emb_map.items()}
-    q_vec=syn_vec.transform([query])
-    lex_sim=cosine_similarity(q_vec,syn_matrix).flatten()
-    lex_scores={ids[i]:float(lex_sim[i]) for i in range(len(ids))}
-    final={
-        eid: semantic_wt*sem_scores.get(eid,0.0)+lexical_wt*lex_scores.get(eid,0.0)
-        for eid in set(ids)}
-
-    ranked=sorted(final.items(),key=lambda x:x[1],reverse=True)[:top_k]
-    ranked_ids=[eid for eid,score in ranked]
-    email_map={e["id"]:e for e in mailstore.get_all_emails()}
-    return [clean_email(email_map[eid]) for eid in ranked_ids if eid in email_map]
+               lexical_wt=0.25,
+               exact:bool=False,
+               snippet_len:int|None=None,
+               mode:str="exhaustive",
+               category=None,
+               sender=None,
+               since=None,
+               until=None):
+    """
+    Hybrid semantic + lexical search over the resident index.
+
+    Parameters: -
+    query: search text
+    top_k: number of emails returned
+    semantic_wt, lexical_wt: fusion weights of the dense and TF-IDF cosine scores
+    exact: skip ANN and brute force the semantic side
+    snippet_len: cut returned bodies to this many characters
+    mode: "exhaustive" scores every email (ANN assisted on large inboxes), "two_stage"
+    takes a BM25 shortlist from the inverted index and fuses scores only on it
+    category, sender, since, until: metadata filters, applied as masks inside the index
+    before scoring
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+    index=index_holder.get()
+    if index is None or len(index)==0: return []
+
+    mask=index.filter_mask(category=category,sender=sender,since=since,until=until)
+    allowed=None if mask is None else np.flatnonzero(mask)
+    if allowed is not None and len(allowed)==0: return []
+
+    q_emb=query_batcher.encode(query)
+    q_vec=index.vectorizer.transform([query])
+    min_rows=min(top_k,len(index) if allowed is None else len(allowed))
+    rows=None
+    if mode=="two_stage":
+        rows=restrict(shortlist_candidates(index,query,top_k),mask,min_rows)
+    if rows is None and not exact and ann_ready(index) and (allowed is None or len(allowed)>=ANN_MIN_DOCS):
+        rows=restrict(ann_candidates(index,q_emb,q_vec,top_k),mask,min_rows)
+    if rows is None:
+        rows=allowed
+    rescore=RESCORE_N if QUANTIZE=="int8" else None
+    ranked=index.search(q_emb,q_vec,
+                        top_k=top_k,
+                        semantic_wt=semantic_wt,
+                        lexical_wt=lexical_wt,
+                        rows=rows,
+                        rescore=rescore)
+    ranked_ids=index.id_values([eid for eid,score in ranked])
+    return [clean_email(e) for e in mailstore.get_emails_by_ids(ranked_ids,snippet_len=snippet_len)]
 
 #build_idx()
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from backend.rag.rag_index import RagIndex,N_FEATURES
+from backend.utils.logging_cfg import logger
+
+
+SNAPSHOT_FORMAT=1
+KEEP_SNAPSHOTS=2
+
+
+class DiskSnapshotStore:
+    """
+    Versioned on-disk index snapshots. Each version is a directory of raw .npy files
+    (embedding matrix, CSR arrays, idf, id/hash tables) plus a meta.json, and a CURRENT
+    file names the active version. Snapshots are opened with np.load(mmap_mode="r"), so
+    a restarted or additional worker attaches to the index without deserializing it and
+    all processes on the host share the same page cache.
+
+    Parameters: -
+    root: directory holding the snapshots
+    """
+    def __init__(self,root:str):
+        self.root=root
+
+    def _dir(self,version)->str:
+        return os.path.join(self.root,f"v{version}")
+
+    def published_version(self):
+        try:
+            with open(os.path.join(self.root,"CURRENT"),"r",encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError,ValueError):
+            return None
+
+    def has(self,version)->bool:
+        return os.path.exists(os.path.join(self._dir(version),"meta.json"))
+
+    def save(self,index:RagIndex):
+        """
+        Writes the snapshot into a temp dir private to this call and renames it into
+        place, then flips CURRENT with os.replace. Concurrent writers of the same version,
+        whether other processes or other threads of this one (the builder and a search
+        thread reloading the index), are harmless: the first rename wins and the others
+        discard their copy.
+        """
+        os.makedirs(self.root,exist_ok=True)
+        final=self._dir(index.version)
+        if not self.has(index.version):
+            tmp=tempfile.mkdtemp(dir=self.root,prefix=f"v{index.version}.")
+            # mkdtemp is owner-only; the snapshot is shared with every worker on the host
+            os.chmod(tmp,0o755)
+            for name,value in index.to_arrays(derived=True).items():
+                arr=np.array(value,dtype=str) if isinstance(value,list) else np.ascontiguousarray(value)
+                np.save(os.path.join(tmp,f"{name}.npy"),arr,allow_pickle=False)
+            with open(os.path.join(tmp,"meta.json"),"w",encoding="utf-8") as f:
+                json.dump({"format":SNAPSHOT_FORMAT,
+                           "version":index.version,
+                           "n":len(index),
+                           "n_features":int(index.counts.shape[1])},f)
+            try:
+                os.rename(tmp,final)
+            except OSError:
+                shutil.rmtree(tmp,ignore_errors=True)
+                if not self.has(index.version): raise
+
+        fd,pointer=tempfile.mkstemp(dir=self.root,prefix="CURRENT.")
+        with os.fdopen(fd,"w",encoding="utf-8") as f:
+            f.write(str(index.version))
+        os.chmod(pointer,0o644)
+        os.replace(pointer,os.path.join(self.root,"CURRENT"))
+        self.prune()
+
+    def load(self,version=None)->RagIndex|None:
+        version=self.published_version() if version is None else version
+        if version is None or not self.has(version): return None
+        path=self._dir(version)
+        with open(os.path.join(path,"meta.json"),"r",encoding="utf-8") as f:
+            meta=json.load(f)
+        if meta.get("format")!=SNAPSHOT_FORMAT: return None
+
+        arrays={}
+        for fname in os.listdir(path):
+            if fname.endswith(".npy"):
+                arrays[fname[:-4]]=np.load(os.path.join(path,fname),mmap_mode="r",allow_pickle=False)
+        return RagIndex.from_arrays(version,arrays,meta.get("n_features",N_FEATURES),normalized=True)
+
+    def prune(self,keep:int=KEEP_SNAPSHOTS):
+        # mapped files stay valid after unlink, so readers of an old version are unaffected
+        versions=sorted(
+            int(d[1:]) for d in os.listdir(self.root)
+            if d.startswith("v") and d[1:].isdigit())
+        for version in versions[:-keep]:
+            shutil.rmtree(self._dir(version),ignore_errors=True)
+
+
+class SnapshotBackedStore:
+    """
+    Mongo stays the source of truth for the published version; the disk snapshot is a
+    per-host materialization of it. Loading prefers a local snapshot of the published
+    version and only falls back to streaming segments from mongo (writing the snapshot
+    for the next worker) when the host doesn't have it yet.
+
+    Parameters: -
+    remote: MongoIndexStore
+    disk: DiskSnapshotStore
+    """
+    def __init__(self,remote,disk:DiskSnapshotStore):
+        self.remote=remote
+        self.disk=disk
+
+    def published_version(self):
+        return self.remote.published_version()
+
+    def save(self,index:RagIndex):
+        if not self.remote.save(index): return
+        try:
+            self.disk.save(index)
+        except OSError as e:
+            logger.warning(f"[RAG] Could not write disk snapshot v{index.version}:{e}")
+
+    def load(self)->RagIndex|None:
+        version=self.remote.published_version()
+        if version is None: return None
+        if self.disk.has(version):
+            return self.disk.load(version)
+
+        index=self.remote.load()
+        if index is None: return None
+        try:
+            self.disk.save(index)
+            return self.disk.load(index.version)
+        except OSError as e:
+            logger.warning(f"[RAG] Could not write disk snapshot v{index.version}:{e}")
+            return index
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+from datetime import datetime,timezone
+from pymongo import MongoClient,ASCENDING
+
+DB_URL=os.getenv("MONGO_URI","mongodb://localhost:27017")
+# fail fast when mongo is down, a cache lookup must never hold up the LLM call
+LLM_CACHE_MONGO_TIMEOUT_MS=int(os.getenv("LLM_CACHE_MONGO_TIMEOUT_MS","500"))
+client=MongoClient(DB_URL,serverSelectionTimeoutMS=LLM_CACHE_MONGO_TIMEOUT_MS)
+db=client["RTTE"]
+LLM_Cache=db["LLM_Cache"]
+
+LLM_CACHE_ENABLED=os.getenv("LLM_CACHE_ENABLED","1")=="1"
+LLM_CACHE_TTL_S=int(os.getenv("LLM_CACHE_TTL_S",str(7*24*3600)))
+LLM_CACHE_LRU_SIZE=int(os.getenv("LLM_CACHE_LRU_SIZE","2048"))
+
+# safe_llm_call contexts whose output only depends on (prompt template, model, input),
+# mapped to the template they use. Drafts, general chat and superquery are not cached.
+CACHEABLE_CONTEXTS={
+    "categorization":"ag_categorization",
+    "action_item":"ag_action_item",
+    "summary":"ag_summary",
+    "triage":"ag_triage",
+    "intent_classification":"sys_intent",
+}
+
+# JSON contexts and the key their caller reads; an answer json_parser can't get that
+# key out of is returned to the caller but never cached, so a bad generation is retried
+CACHE_JSON_KEYS={
+    "categorization":"category",
+    "action_item":"tasks",
+    "triage":"category",
+    "intent_classification":"intent",
+}
+
+
+class LLMResponseCache:
+    """
+    Two level cache for deterministic LLM calls: an in-process LRU in front of a mongo
+    collection with a TTL index. The key hashes the model name and the full rendered
+    prompt, which already contains the active template text and the input, so editing a
+    template can never serve an answer generated from the old one; invalidate() only
+    drops those now unreachable entries early.
+
+    Parameters: -
+    collection: mongo collection backing the cache
+    ttl_s: lifetime of a mongo entry
+    lru_size: entries kept in process
+    """
+    def __init__(self,collection,ttl_s:int=LLM_CACHE_TTL_S,lru_size:int=LLM_CACHE_LRU_SIZE):
+        self.collection=collection
+        self.ttl_s=ttl_s
+        self.lru_size=lru_size
+        self._lru=OrderedDict()
+        self._lock=threading.Lock()
+        self._indexed=False
+        self.hits=0
+        self.misses=0
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self.collection.create_index([("created_at",ASCENDING)],expireAfterSeconds=self.ttl_s)
+            self.collection.create_index([("template",ASCENDING)])
+            self._indexed=True
+
+    @staticmethod
+    def key(model:str,prompt:str)->str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _remember(self,key:str,template:str,response:str):
+        with self._lock:
+            self._lru[key]=(template,response)
+            self._lru.move_to_end(key)
+            while len(self._lru)>self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get(self,model:str,prompt:str):
+        key=self.key(model,prompt)
+        with self._lock:
+            entry=self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                self.hits+=1
+                return entry[1]
+
+        doc=self.collection.find_one({"_id":key},{"template":1,"response":1,"created_at":1})
+        # the TTL monitor only runs once a minute, so expiry is checked here as well
+        if doc is None or self._expired(doc):
+            with self._lock:
+                self.misses+=1
+            return None
+        self._remember(key,doc.get("template"),doc["response"])
+        with self._lock:
+            self.hits+=1
+        return doc["response"]
+
+    def _expired(self,doc)->bool:
+        created=doc.get("created_at")
+        if created is None: return False
+        if created.tzinfo is None:
+            created=created.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc)-created).total_seconds()>self.ttl_s
+
+    def put(self,model:str,prompt:str,template:str,response:str):
+        key=self.key(model,prompt)
+        self._ensure_index()
+        self.collection.replace_one({"_id":key},
+                                    {"_id":key,"template":template,"model":model,"response":response,
+                                     "created_at":datetime.now(timezone.utc)},
+                                    upsert=True)
+        self._remember(key,template,response)
+
+    def invalidate(self,templates:list)->int:
+        """
+        Drops cached responses produced with any of the given prompt templates. Returns
+        the number of mongo entries removed.
+        """
+        if not templates: return 0
+        with self._lock:
+            for key in [k for k,(t,_) in self._lru.items() if t in templates]:
+                del self._lru[key]
+        return self.collection.delete_many({"template":{"$in":list(templates)}}).deleted_count
+
+    def stats(self)->dict:
+        with self._lock:
+            return {"enabled":LLM_CACHE_ENABLED,"hits":self.hits,"misses":self.misses,
+                    "lru_entries":len(self._lru)}
+
+
+cache=LLMResponseCache(LLM_Cache)
@@ -1,12 +1,218 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+import httpx
 import requests
 
-OLLAMA_URL="http://localhost:11434/api/generate"
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.logging_cfg import logger
+
+OLLAMA_URL=os.getenv("OLLAMA_URL","http://localhost:11434/api/generate")
 MODEL_NAME="deepseek-llm:7b-chat"
 
+LLM_CONNECT_TIMEOUT=float(os.getenv("LLM_CONNECT_TIMEOUT","5"))
+# a full 7b generation on CPU can take minutes, this only guards against a wedged server
+LLM_READ_TIMEOUT=float(os.getenv("LLM_READ_TIMEOUT","300"))
+LLM_RETRIES=int(os.getenv("LLM_RETRIES","3"))
+LLM_BACKOFF=float(os.getenv("LLM_BACKOFF","0.5"))
+LLM_POOL_SIZE=int(os.getenv("LLM_POOL_SIZE","8"))
+# the async client holds sockets, not threads, so it can keep many generations in flight
+LLM_ASYNC_MAX_CONN=int(os.getenv("LLM_ASYNC_MAX_CONN","256"))
+RETRY_STATUSES=(429,500,502,503,504)
+
+
+def make_session(retries:int=LLM_RETRIES,
+                 backoff:float=LLM_BACKOFF,
+                 pool_size:int=LLM_POOL_SIZE)->requests.Session:
+    """
+    Keep-alive session shared by every LLM call. Connection failures and 429/5xx answers
+    are retried with exponential backoff; read timeouts are not, since re-sending a
+    prompt the server may still be generating only doubles the load.
+
+    Parameters: -
+    retries: retry budget per call
+    backoff: backoff factor, sleeps backoff*2^(n-1) between attempts
+    pool_size: kept-alive connections, should cover the ingest thread count
+    """
+    retry=Retry(total=retries,connect=retries,read=0,status=retries,
+                backoff_factor=backoff,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({"POST"}),
+                raise_on_status=False)
+    adapter=HTTPAdapter(pool_connections=1,pool_maxsize=pool_size,max_retries=retry)
+    session=requests.Session()
+    session.mount("http://",adapter)
+    session.mount("https://",adapter)
+    return session
+
+
+class LLMMetrics:
+    """
+    Running totals of LLM calls. Token counts and durations come from ollama's response
+    (eval_count, eval_duration, prompt_eval_duration, reported in nanoseconds); latency is
+    wall clock around the HTTP call, so it includes queueing and model load.
+    """
+    def __init__(self):
+        self._lock=threading.Lock()
+        self.calls=0
+        self.errors=0
+        self.latency_s=0.0
+        self.prompt_tokens=0
+        self.completion_tokens=0
+        self.prompt_eval_s=0.0
+        self.eval_s=0.0
+        self.last=None
+
+    def record(self,latency_s:float,body:dict,ttft_s:float|None=None)->dict:
+        call={
+            "latency_s":round(latency_s,3),
+            "ttft_s":round(ttft_s,3) if ttft_s is not None else None,
+            "prompt_tokens":body.get("prompt_eval_count",0),
+            "completion_tokens":body.get("eval_count",0),
+            "prompt_eval_s":body.get("prompt_eval_duration",0)/1e9,
+            "eval_s":body.get("eval_duration",0)/1e9,
+        }
+        call["tokens_per_s"]=round(call["completion_tokens"]/call["eval_s"],2) if call["eval_s"] else None
+        with self._lock:
+            self.calls+=1
+            self.latency_s+=latency_s
+            self.prompt_tokens+=call["prompt_tokens"]
+            self.completion_tokens+=call["completion_tokens"]
+            self.prompt_eval_s+=call["prompt_eval_s"]
+            self.eval_s+=call["eval_s"]
+            self.last=call
+        return call
+
+    def record_error(self):
+        with self._lock:
+            self.errors+=1
+
+    def snapshot(self)->dict:
+        with self._lock:
+            return {
+                "calls":self.calls,
+                "errors":self.errors,
+                "avg_latency_s":round(self.latency_s/self.calls,3) if self.calls else None,
+                "prompt_tokens":self.prompt_tokens,
+                "completion_tokens":self.completion_tokens,
+                "tokens_per_s":round(self.completion_tokens/self.eval_s,2) if self.eval_s else None,
+                "last":self.last,
+            }
+
+
+session=make_session()
+metrics=LLMMetrics()
+
+
 def run_llm(prompt:str,
             model:str=MODEL_NAME)->str:
-    response=requests.post(
-        OLLAMA_URL,
-        json={"model":model,"prompt":prompt,"stream":False})    
-    return response.json()["response"]
+    started=time.perf_counter()
+    try:
+        response=session.post(
+            OLLAMA_URL,
+            json={"model":model,"prompt":prompt,"stream":False},
+            timeout=(LLM_CONNECT_TIMEOUT,LLM_READ_TIMEOUT))
+        response.raise_for_status()
+        body=response.json()
+    except Exception:
+        metrics.record_error()
+        raise
+    call=metrics.record(time.perf_counter()-started,body)
+    logger.debug(f"[LLM] model={model} latency={call['latency_s']}s "
+                 f"prompt_tokens={call['prompt_tokens']} completion_tokens={call['completion_tokens']} "
+                 f"tokens_per_s={call['tokens_per_s']}")
+    return body["response"]
+
+
+# one AsyncClient per event loop: its pooled connections belong to the loop that opened
+# them, and sync callers run the async agent functions on short lived loops of their own
+_async_clients=weakref.WeakKeyDictionary()
+
+
+def get_async_client()->httpx.AsyncClient:
+    """
+    Shared AsyncClient for the async LLM calls, created on first use inside the running
+    event loop. The transport retries connection failures; retryable statuses are
+    handled in _apost().
+    """
+    loop=asyncio.get_running_loop()
+    client=_async_clients.get(loop)
+    if client is None:
+        client=httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT,connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=LLM_ASYNC_MAX_CONN,
+                                max_keepalive_connections=LLM_POOL_SIZE),
+            transport=httpx.AsyncHTTPTransport(retries=LLM_RETRIES))
+        _async_clients[loop]=client
+    return client
+
+
+async def aclose_async_client():
+    client=_async_clients.pop(asyncio.get_running_loop(),None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _apost(payload:dict)->dict:
+    client=get_async_client()
+    for attempt in range(LLM_RETRIES+1):
+        response=await client.post(OLLAMA_URL,json=payload)
+        if response.status_code not in RETRY_STATUSES or attempt==LLM_RETRIES:
+            response.raise_for_status()
+            return response.json()
+        await asyncio.sleep(LLM_BACKOFF*2**attempt)
+
+
+async def arun_llm(prompt:str,
+                   model:str=MODEL_NAME)->str:
+    """
+    Async run_llm(): same request, timeouts, retries and metrics, but awaiting the
+    generation holds a socket instead of a worker thread.
+    """
+    started=time.perf_counter()
+    try:
+        body=await _apost({"model":model,"prompt":prompt,"stream":False})
+    except Exception:
+        metrics.record_error()
+        raise
+    call=metrics.record(time.perf_counter()-started,body)
+    logger.debug(f"[LLM] model={model} latency={call['latency_s']}s "
+                 f"prompt_tokens={call['prompt_tokens']} completion_tokens={call['completion_tokens']} "
+                 f"tokens_per_s={call['tokens_per_s']}")
+    return body["response"]
+
 
+async def arun_llm_stream(prompt:str,
+                          model:str=MODEL_NAME):
+    """
+    Yields response chunks as ollama generates them (stream=True, one JSON object per
+    line). Metrics are recorded from the final done chunk, together with the time to
+    the first token.
+    """
+    started=time.perf_counter()
+    ttft=None
+    try:
+        async with get_async_client().stream(
+                "POST",OLLAMA_URL,json={"model":model,"prompt":prompt,"stream":True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line: continue
+                chunk=json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error:{chunk['error']}")
+                if chunk.get("response"):
+                    if ttft is None:
+                        ttft=time.perf_counter()-started
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    call=metrics.record(time.perf_counter()-started,chunk,ttft_s=ttft)
+                    logger.debug(f"[LLM] model={model} stream ttft={call['ttft_s']}s latency={call['latency_s']}s "
+                                 f"completion_tokens={call['completion_tokens']} tokens_per_s={call['tokens_per_s']}")
+                    break
+    except Exception:
+        metrics.record_error()
+        raise
@@ -13,6 +13,18 @@ def init_prompt(prompt_data:dict):
     print("prompt init doneee")
 
 
+def seed_prompts(prompt_data:dict)->list:
+    """
+    Adds default prompts that are missing from the active document, leaving prompts the
+    user already changed untouched. Returns the keys that were added.
+    """
+    current=load_prompts()
+    missing={k:v for k,v in prompt_data.items() if k!="_id" and k not in current}
+    if missing:
+        Prompts.update_one({"_id":"active_prompts"},{"$set":missing},upsert=True)
+    return list(missing)
+
+
 def load_prompts()->dict:
     doc=Prompts.find_one({"_id":"active_prompts"})
     return doc if doc else {}
@@ -96,6 +108,45 @@ Output JSON ONLY:
 """),
 
 
+    "ag_triage": tw.dedent("""
+You triage an email in ONE pass: categorize it and extract its tasks.
+You ALWAYS represent the RECIPIENT of the email (the person who received it).
+Never speak as the sender.
+
+### STEP 1: CATEGORY
+Assign EXACTLY ONE category from this list:
+
+["Important", "To-Do", "Newsletter", "Spam", "Meeting", "Personal"]
+
+- “Spam”: phishing, scams, prize announcements, fake alerts, malware links.
+- “Newsletter”: subscriptions, digests, news updates, industry reports.
+- “To-Do”: the email asks the user to perform an action.
+- “Important”: security alerts, HR notices, compliance, account activity, deadlines.
+- “Meeting”: scheduling, coordination, calls, interviews.
+- “Personal”: friends, family, informal messages.
+
+### STEP 2: TASKS
+A “task” is something the sender expects YOU (the recipient) to do:
+send, prepare, reply, confirm, review, attend, submit, schedule.
+
+Rules:
+- If the category is "Spam", tasks MUST be an empty list.
+- If urgency is implied (“as soon as possible”), deadline = "ASAP".
+- If a specific date/time is mentioned, use that as the deadline.
+- If no deadline exists, use null.
+- If no tasks exist, return an empty list.
+
+### OUTPUT FORMAT (MANDATORY)
+Output ONLY valid JSON:
+{
+  "category": "<one_of_the_categories>",
+  "tasks": [
+    { "task": "...", "deadline": "..." }
+  ]
+}
+"""),
+
+
     "ag_autodraft_reply": tw.dedent("""
 Write a reply AS THE RECIPIENT of the email.
 You are NOT the sender. You are the one responding.